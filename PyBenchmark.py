@@ -0,0 +1,266 @@
+'''
+PyBenchmark: benchmarks for PyInterpreter.
+
+Usage
+
+  python PyBenchmark.py load [maxLines]
+    Measures the time setScript needs to preprocess and compile generated scripts
+    of 1k lines up to maxLines lines (default 1M). Time per line should stay the same
+    for all script sizes.
+
+  python PyBenchmark.py run [options]
+    Runs the benchmark scripts (tight for loop, nested loops, gosub recursion,
+    f-string formatting, system function calls and a long generated script) and
+    reports for each script and backend:
+      load   : time for setScript (preprocess and compile) in ms
+      run    : time for runScript in ms (for python backend including transpiling)
+      stmts/s: executed statements per second
+      peak   : peak memory of load and run in kB (measured in a separate run)
+    Options
+      --backend interpreter,python  backends to measure
+      --repeat N                    best of N runs (default 3)
+      --scale F                     multiply loop counts by F (e.g. 0.1 for quick check)
+      --only name,name              only run these benchmarks
+      --save file.json              save results as baseline
+      --compare file.json           compare with baseline and exit with 1 on regression
+      --tolerance F                 allowed slowdown / memory growth (default 0.25 = 25%)
+    A benchmark also fails if the script reports errors or if the number of executed
+    statements differs from the baseline. Everything runs offline, so this can be
+    used as a gate before upgrading the interpreter, e.g.
+      python PyBenchmark.py run --save baseline.json        (with current version)
+      python PyBenchmark.py run --compare baseline.json     (with new version)
+'''
+
+import sys
+import time
+import json
+import platform
+import argparse
+import tracemalloc
+
+import PyInterpreter
+
+#####################################################
+# SCRIPT GENERATION
+#####################################################
+LOAD_UNIT=["for x 0 3 {\n",
+           "  if x%2==0 {\n",
+           "    i i+1\n",
+           "  }else{\n",
+           "    i i-1\n",
+           "  }\n",
+           "}\n",
+           "while i<0 {\n",
+           "  i i+1\n",
+           "}\n",
+          ]
+
+def generateScript(nrLines,unit=LOAD_UNIT):
+    # repeats unit within one outer while loop until script has nrLines lines
+    scriptlines=["var i 0\n","var n 0\n","while n<1 {\n","  n n+1\n"]
+    while len(scriptlines)+len(unit)<nrLines: scriptlines+=unit
+    scriptlines.append("}\n")
+    return scriptlines
+
+def forLoopScript(n):
+    return ["var a 0\n",
+           f"for i 0 {n} {{\n",
+            "  a a+1\n",
+            "}\n"]
+
+def nestedLoopScript(n):
+    return ["var s 0\n",
+           f"for i 0 {n} {{\n",
+           f"  for j 0 {n} {{\n",
+            "    s s+i*j\n",
+            "  }\n",
+            "}\n"]
+
+def recursionScript(n,depth=50):
+    return ["var depth 0\n",
+            "var calls 0\n",
+            "sub recurse\n",
+            "  calls calls+1\n",
+           f"  if depth<{depth} {{\n",
+            "    depth depth+1\n",
+            "    gosub recurse\n",
+            "    depth depth-1\n",
+            "  }\n",
+            "return\n",
+           f"for r 0 {n} {{\n",
+            "  gosub recurse\n",
+            "}\n"]
+
+def formatScript(n):
+    return ["var s \"\"\n",
+           f"for i 0 {n} {{\n",
+            "  s f\"{i:05d} {i*0.5:.2f} {'ab'*3} {s[:4]}\"\n",
+            "}\n"]
+
+def systemCallScript(n):
+    return [f"for i 0 {n} {{\n",
+             "  noop i\n",
+             "  noop i*2.0\n",
+             "}\n"]
+
+def longScript(n):
+    return generateScript(n)
+
+# name: (function generating script, loop count at scale 1)
+BENCHMARKS={"forLoop"    :(forLoopScript   ,50000),
+            "nestedLoops":(nestedLoopScript,200),
+            "recursion"  :(recursionScript ,200),
+            "format"     :(formatScript    ,20000),
+            "systemCalls":(systemCallScript,20000),
+            "longScript" :(longScript      ,10000),
+           }
+
+def noop(value):
+    pass
+
+#####################################################
+# BENCHMARKS
+#####################################################
+def benchLoad(maxLines=1000000):
+    nrLines=1000
+    while nrLines<=maxLines:
+        scriptlines=generateScript(nrLines)
+        interpreter=PyInterpreter.Interpreter()
+        start=time.perf_counter()
+        interpreter.setScript(scriptlines)
+        duration=time.perf_counter()-start
+        if interpreter.compileErrors: interpreter.printErrorStack()
+        print (f"{len(scriptlines):9} lines {duration:9.3f} s {duration/len(scriptlines)*1e6:7.2f} us/line")
+        nrLines*=10
+
+class CountingInstrs(list):
+    # instruction list which counts the instructions fetched by runProgram
+    count=0
+    def __getitem__(self,pc):
+        self.count+=1
+        return list.__getitem__(self,pc)
+
+def newInterpreter():
+    interpreter=PyInterpreter.Interpreter()
+    interpreter.addSystemFunction('noop',noop,[(int,float),])
+    interpreter.setErrorHandler(lambda errorStack:None)                 # errors are reported in results
+    return interpreter
+
+def countStatements(scriptlines):
+    # returns number of statements executed by script
+    interpreter=newInterpreter()
+    interpreter.setScript(scriptlines)
+    program=interpreter.program
+    program.instrs=CountingInstrs(program.instrs)
+    interpreter.runScript()
+    return program.instrs.count
+
+def benchScript(scriptlines,backend,repeat):
+    # returns dict with best load and run time, peak memory and errors
+    loadTime=runTime=float("inf")
+    for _ in range(repeat):
+        interpreter=newInterpreter()
+        start=time.perf_counter()
+        interpreter.setScript(scriptlines)
+        loadTime=min(loadTime,time.perf_counter()-start)
+        start=time.perf_counter()
+        interpreter.runScript(backend=backend)
+        runTime=min(runTime,time.perf_counter()-start)
+    errors=[error.replace("\n"," ") for error in interpreter.errorStack]
+    # tracemalloc slows down python, so memory is measured in an extra run
+    tracemalloc.start()
+    interpreter=newInterpreter()
+    interpreter.setScript(scriptlines)
+    interpreter.runScript(backend=backend)
+    peakMemory=tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"loadTime":loadTime,"runTime":runTime,"peakMemory":peakMemory,"errors":errors}
+
+def benchRun(backends=("interpreter","python"),repeat=3,scale=1.0,names=None):
+    # returns results as dict {backend:{name:result}}
+    results={backend:{} for backend in backends}
+    print (f"{'benchmark':12} {'backend':12} {'statements':>10} {'load ms':>9} {'run ms':>9} {'stmts/s':>11} {'peak kB':>9}")
+    for name,(makeScript,count) in BENCHMARKS.items():
+        if names and name not in names: continue
+        scriptlines=makeScript(max(1,int(count*scale)))
+        statements=countStatements(scriptlines)
+        for backend in backends:
+            result=benchScript(scriptlines,backend,repeat)
+            result["statements"]=statements
+            result["throughput"]=statements/result["runTime"] if result["runTime"] else 0
+            results[backend][name]=result
+            print (f"{name:12} {backend:12} {statements:10} {result['loadTime']*1e3:9.1f} {result['runTime']*1e3:9.1f} "
+                   f"{result['throughput']:11.0f} {result['peakMemory']/1024:9.0f}")
+            for error in result["errors"]: print (f"  ERROR {error}")
+    return results
+
+# differences in time smaller than this are timer noise and no regression
+MIN_TIME_DIFF=0.005
+
+def compareResults(results,baseline,tolerance=0.25):
+    # returns list of regressions of results compared to baseline results
+    regressions=[]
+    for backend,benchmarks in results.items():
+        for name,result in benchmarks.items():
+            base=baseline.get(backend,{}).get(name)
+            label=f"{name} ({backend})"
+            if result["errors"]:
+                regressions.append(f"{label}: script reports errors")
+            if base is None: continue
+            if result["statements"]!=base["statements"]:
+                regressions.append(f"{label}: executed {result['statements']} statements, baseline {base['statements']}")
+                continue                                                # timings of different work do not compare
+            if result["throughput"]<base["throughput"]*(1-tolerance) and result["runTime"]-base["runTime"]>MIN_TIME_DIFF:
+                regressions.append(f"{label}: throughput {result['throughput']:.0f} stmts/s, baseline {base['throughput']:.0f}")
+            if result["loadTime"]>base["loadTime"]*(1+tolerance) and result["loadTime"]-base["loadTime"]>MIN_TIME_DIFF:
+                regressions.append(f"{label}: load time {result['loadTime']*1e3:.1f} ms, baseline {base['loadTime']*1e3:.1f}")
+            if result["peakMemory"]>base["peakMemory"]*(1+tolerance):
+                regressions.append(f"{label}: peak memory {result['peakMemory']/1024:.0f} kB, baseline {base['peakMemory']/1024:.0f}")
+    return regressions
+
+def saveBaseline(filename,results,scale):
+    with open(filename,"w") as writer:
+        json.dump({"version":PyInterpreter.VERSION,"python":platform.python_version(),
+                   "machine":platform.machine(),"scale":scale,"results":results},writer,indent=1)
+
+def loadBaseline(filename,scale):
+    with open(filename) as reader:
+        baseline=json.load(reader)
+    if baseline.get("scale")!=scale:
+        raise ValueError(f"Baseline {filename} was made with --scale {baseline.get('scale')}.")
+    if baseline.get("python")!=platform.python_version():
+        print (f"Warning: baseline made with python {baseline.get('python')}, now running {platform.python_version()}.")
+    return baseline["results"]
+
+def main(argv):
+    parser=argparse.ArgumentParser(prog="PyBenchmark.py run")
+    parser.add_argument("--backend",default="interpreter,python")
+    parser.add_argument("--repeat",type=int,default=3)
+    parser.add_argument("--scale",type=float,default=1.0)
+    parser.add_argument("--only",default="")
+    parser.add_argument("--save")
+    parser.add_argument("--compare")
+    parser.add_argument("--tolerance",type=float,default=0.25)
+    args=parser.parse_args(argv)
+    try:
+        baseline=loadBaseline(args.compare,args.scale) if args.compare else None
+    except (OSError,ValueError) as e:
+        parser.error(str(e))
+    names=[name for name in args.only.split(",") if name]
+    for name in names:
+        if name not in BENCHMARKS: parser.error(f"unknown benchmark '{name}', choose from {','.join(BENCHMARKS)}")
+    results=benchRun(args.backend.split(","),args.repeat,args.scale,names)
+    if args.save: saveBaseline(args.save,results,args.scale)
+    if baseline is None: return 0
+    regressions=compareResults(results,baseline,args.tolerance)
+    for regression in regressions: print (f"REGRESSION {regression}")
+    print ("FAIL" if regressions else "OK", f"compared with {args.compare}")
+    return 1 if regressions else 0
+
+if __name__=="__main__":
+    if len(sys.argv)>1 and sys.argv[1]=="load":
+        benchLoad(int(sys.argv[2]) if len(sys.argv)>2 else 1000000)
+    elif len(sys.argv)>1 and sys.argv[1]=="run":
+        sys.exit(main(sys.argv[2:]))
+    else:
+        print (__doc__)
@@ -45,24 +45,42 @@ import os
 import time
 import re
 import math
+import functools
+import ast
+import builtins
+import concurrent.futures
+import multiprocessing
+import multiprocessing.connection
+import hashlib
+import marshal
+import mmap
+import gc
+import tempfile
+import importlib.util
+import copy
+import inspect
+import dis
+import operator
+import typing
+import types
+import asyncio
+import pickle
+import sys
+import json
+import argparse
+import threading
+import warnings
+import collections
+import array as pyarray
+try:
+    import numpy                                                        # optional, makes array operations vectorized
+except ImportError:
+    numpy=None
 
 # GLOBALS
 scriptpath= os.path.realpath(__file__) 
 scriptdir = os.path.dirname(scriptpath)
-
-# FOLLOWING VARS, SYSTEM FUNCTIONS can be called from scipt
-systemVars={'version':'09.02.21'}
-systemDefs={'print'  :(print,[[bool,int,float,str],]),}
-callStack=[]
-errorStack=[]
-
-def clearGlobals():
-    global systemVars,systemVars,callStack,errorStack
-    systemVars={'version':'09.02.21'}
-    systemDefs={'print'  :(print,[[bool,int,float,str],]),}
-    callStack=[]
-    errorStack=[]
-
+VERSION   = '09.02.21'
 
 def millis():
     return time.time()*1000
@@ -70,238 +88,546 @@ def millis():
 #####################################################
 # ERROR TRACING
 #####################################################
-errorHandler=None
-def logError(lineNr,scriptline,token,errMsg):
-    errLine=f"{lineNr+1:04} > '{scriptline.strip()}'\n"
-    if token: errLine+=f"Token: '{token}'\n"
+def logError(errorStack,lineNr,scriptline,token,errMsg,column=None):
+    # column (starting at 0) of token in original scriptline is shown starting at 1, with a
+    # column scriptline should be the original line, which is shown with its indentation so
+    # the column points at the token, without a column it can be the (rewritten) statement
+    errLine=f"{lineNr+1:04} > '{scriptline.rstrip() if column is not None else scriptline.strip()}'\n"
+    if token: errLine+=f"Token: '{token}'"+(f" (column {column+1})" if column is not None else "")+"\n"
+    elif column is not None: errLine+=f"Column: {column+1}\n"
     errLine+=f"{errMsg}"
     errorStack.append (errLine)  
 
-def printErrorStack():
-    if not errorHandler:
-        if errorStack:
-            print ("Errors found:")
-            for error in errorStack:
-                print (error)
-                print ('\n')
-    else:
-        errorHandler(errorStack)            
-quitOnError=True # needed for debugging error messages
+def warnShadowed(names):
+    # labels hide system vars with the same name, this does not stop the script
+    warnings.warn(f"Labels hide system variables with the same name: {', '.join(names)}.",RuntimeWarning,stacklevel=3)
 
 
 #####################################################
-# CODE REWRITING
+# LEXING
 #####################################################
-def replaceOutsideQuotes(strLine,replaceDict):
-    parts=strLine.split('"')
-    for pNr in range(0,len(parts),2): # ony part #0,2,4... are outside of quotes
-        for oldSeq in replaceDict:
-            newSeq=replaceDict[oldSeq]
-            parts[pNr]=parts[pNr].replace(oldSeq,newSeq)
-    #print (parts)
-    strLine='"'.join(parts)
-    return strLine
-
-def findIfElse(scriptlines,fromLineNr):
-    #fromLineNr should be linenr of if-statement
-    level=1
-    #print ("----")
-    for lineNr in range(fromLineNr+1,len(scriptlines)):
-        scriptline = scriptlines[lineNr]
-        statements = scriptline2statements(scriptline)
-        if statements:
-            for statement in statements:
-                tokens=statement2tokens(statement)
-                if tokens[0]=="}": level-=1
-                if tokens[-1]=="{": level+=1
-                if tokens[0]=="}else{" and level==1: return lineNr
-        #print (f"{lineNr} : {level} > '{scriptline.strip()}'")
-        if level==0: return -1
-    #if nothing found we return -1 so rewrite macros can append error to stack
-    return -1
-
-def findGroupEnd(scriptlines,fromLineNr):
-    #fromLineNr should be linenr of if-statement
-    level=1
-    for lineNr in range(fromLineNr+1,len(scriptlines)):
-        scriptline = scriptlines[lineNr]
-        statements = scriptline2statements(scriptline)
-        if statements:
-            for statement in statements:
-                tokens=statement2tokens(statement)
-                for token in tokens[1:-1]:
-                    if token=="{" or token=="}": return -1
-                if tokens[0]=="}": level-=1
-                if tokens[-1]=="{": level+=1
-                if level==0: return lineNr
-
-    #if nothing found we return -1 so rewrite macros can append error to stack
-    return -1
-
-def findSubEnd(scriptlines,fromLineNr):
-    level=1
-    for lineNr in range(fromLineNr+1,len(scriptlines)):
-        scriptline = scriptlines[lineNr]
-        statements = scriptline2statements(scriptline)
-        if statements:
-            for statement in statements:
-                tokens=statement2tokens(statement)
-                if tokens[0]=="return": level-=1
-                if tokens[0]=="sub": level+=1
-                if level==0: return lineNr
-
-    #if nothing found we return -1 so rewrite macros can append error to stack
-    return -1
-
-def removeRemarks(scriptlines):
-    for lnr,scriptline in enumerate(scriptlines):
-        # remove remarks
-        if len(scriptline.strip())==0:       #do nothing if empty    
-            #print (f"{lnr} empty")
-            scriptlines[lnr]="\n"
-        elif scriptline.strip()[0]=='#': 
-            scriptlines[lnr]="\n"
-            #print (f"{lnr} comment")
-        else:    
-            #count nr quotes
-            if scriptline.count('"')%2==1:     # if odd number of quotes, the line is malformed
-                logError(lnr,scriptline,None,"SyntaxError: String not closed on line.")
-                return False
-            #remove remark 
-            PATTERN_REMARKS = re.compile(r'''((?:[^#"']|"[^"]*"|'[^']*')+)''')    
-            scriptline= PATTERN_REMARKS.split(scriptline)[1::2][0]  
-            scriptlines[lnr]=scriptline
-
-    return scriptlines
-
-def rewriteSyntax(scriptlines):    
-    for lineNr,scriptline in enumerate(scriptlines):
-        #replacements are now not specific for commands, but can be made by checking against first token
-        #  cmd=statement2tokens(scriptline)[0]
-        replaceDict={'  ' :' ',
-                    ' = ':' ', 
-                    ' : ': ' ',
-                    '...':' '}
-        scriptlines[lineNr]=replaceOutsideQuotes(scriptline,replaceDict)
-    return scriptlines
-
-def rewriteMacros(scriptlines):
-    # ; not accounted for
+# Each scriptline is scanned once by PATTERN_TOKENS into statements, each a list of
+# tokens with a list of the columns (starting at 0) of these tokens. Tokens are
+# separated by whitespace and statements by ';', a remark starts with '#'. Strings
+# between double or single quotes are part of a token and can contain all of these.
+# The optional '...' separates tokens like a space and single '=' and ':' tokens
+# are skipped, so 'for i = 0 ... 10 : 2 {' becomes 'for i 0 10 2 {'.
+
+# group 1 is a token, otherwise the match is '...', ';', '#' or a quote of a string which is not closed
+PATTERN_TOKENS=re.compile(r'''((?:[^\s;#"'.]|\.(?!\.\.)|"[^"]*"|'[^']*')+)|\.\.\.|[;#"']''')
+SKIPPED_TOKENS=('=',':')
+
+def lexLine(scriptline):
+    # returns list of statements (tokens,columns) and the column of a string which is not closed or None
+    statements=[]
+    tokens=[]
+    columns=[]
+    for match in PATTERN_TOKENS.finditer(scriptline):                      # whitespace is skipped by finditer
+        token=match.group(1)
+        if token is not None:
+            if token not in SKIPPED_TOKENS:
+                tokens.append(token)
+                columns.append(match.start())
+            continue
+        char=match.group()
+        if char=="...": continue
+        if tokens: statements.append((tokens,columns))
+        if char==";":
+            tokens=[]
+            columns=[]
+            continue
+        return statements,(match.start() if char!="#" else None)
+    if tokens: statements.append((tokens,columns))
+    return statements,None
+
+def lexLines(scriptlines,errorStack):
+    # yields statements of each scriptline
     for lineNr,scriptline in enumerate(scriptlines):
-        tokens=statement2tokens(scriptline)
-        scriptline=scriptline.strip() # for printing errorStack without \n
-        
-        if tokens:
-            #print (f"{lineNr}> '{scriptline:20}'   Tokens:{len(tokens)} {tokens}")        
-            cmd=tokens[0]
+        statements,column=lexLine(scriptline)
+        if column is not None: logError(errorStack,lineNr,scriptline,None,"SyntaxError: String not closed on line.",column)
+        yield statements
 
-            if cmd=="if" and tokens[-1]=="{":
-                if len(tokens)!=3:  
-                    logError(lineNr,scriptline,None,f"SyntaxError: If statement has {('more','less')[len(tokens)<3]} tokens than expected.")
-                    return False          
-                else:
-                    jumpNr=findGroupEnd(scriptlines,lineNr)                                         # find closing bracket
-                    elseNr=findIfElse(scriptlines,lineNr)
-                    fndClosingBracket = (jumpNr>=0)
-                    fndElse           = (elseNr>=0)
-                    #print (f"lineNr:{lineNr:2}  elseNr:{elseNr:2}  endNr:{jumpNr:2}")
-                    if fndClosingBracket:                                                           # if } found
-                        cond=tokens[1]
-                        if fndElse:
-                            scriptlines[lineNr]=f"if not({cond}) {elseNr+1}\n"#                               # {scriptlines[lineNr]}"
-                            scriptlines[elseNr]=f"goto {jumpNr}\n"##                                                     # {scriptlines[jumpNr]}"            
-                        else:
-                            scriptlines[lineNr]=f"if not({cond}) {jumpNr}\n"#                               # {scriptlines[lineNr]}"
-                        scriptlines[jumpNr]=f"\n"##                                                     # {scriptlines[jumpNr]}"            
-                    else:   
-                        logError(lineNr,scriptline,None,f"SyntaxError: If statement is missing closing bracket {'}'}.")
-                        return False            
-            if cmd=="while":
-                if tokens[-1]!="{" or len(tokens)!=3:  
-                    logError(lineNr,scriptline,None,f"SyntaxError: While statement has {('more','less')[len(tokens)<3]} tokens than expected.")
-                    return False          
-                else:
-                    jumpNr=findGroupEnd(scriptlines,lineNr)                                         # find closing bracket
-                    fndClosingBracket = (jumpNr>=0)
-                    if fndClosingBracket:                                                           # if } found
-                        cond=tokens[1]
-                        scriptlines[lineNr]=f"if not({cond}) {jumpNr}\n"#                               # {scriptlines[lineNr]}"
-                        scriptlines[jumpNr]=f"if {cond} {lineNr}\n"#                                    # {scriptlines[jumpNr]}"
-                    else:                                                                           # if } not found
-                        logError(lineNr,scriptline,None,f"SyntaxError: While statement is missing closing bracket {'}'}.")
-                        return False            
-            if cmd=="for":
-                if tokens[-1]!="{" or (len(tokens)!=5 and len(tokens)!=6):  
-                    logError(lineNr,scriptline,None,f"SyntaxError: For statement has {('more','less')[len(tokens)<5]} tokens than expected.")
-                    return False          
-                else:
-                    tkVar  = tokens[1]
-                    tkFrom = tokens[2]
-                    tkTo   = tokens[3]
-                    tkStep = tokens[4] if len(tokens)==6 else 1
-                    jumpNr=findGroupEnd(scriptlines,lineNr)                                         # find closing bracket
-                    fndClosingBracket = (jumpNr>=0)
-                    if fndClosingBracket:                                                           # if } found
-                        scriptlines[lineNr]=f"var {tkVar} {tkFrom}\n"#                                  # {scriptlines[lineNr]}"
-                        if int(tkStep)>0:
-                            scriptlines[jumpNr]=f"{tkVar} {tkVar}+{tkStep} ; if {tkVar}<{tkTo} {lineNr+1}\n"#  # {scriptlines[jumpNr]}"
-                        else:    
-                            scriptlines[jumpNr]=f"{tkVar} {tkVar}+{tkStep} ; if {tkVar}>{tkTo} {lineNr+1}\n"#  # {scriptlines[jumpNr]}"
-                    else:                                                                           # if } not found
-                        logError(lineNr,scriptline,None,f"SyntaxError: For statement is missing closing bracket {'}'}.")
-                        return False  
-    
+def lexScript(scriptlines,errorStack):
+    # returns list of statements of each scriptline
+    return list(lexLines(scriptlines,errorStack))
 
-    #with open(os.path.join(scriptdir,"debug.raw"), "w") as reader: # open file
-    #    reader.writelines(scriptlines)      # read all lines
-
-    return scriptlines
+def lineText(statements):
+    # text of line with statements, used in error messages
+    return " ; ".join(" ".join(tokens) for tokens,columns in statements)
 
+def lineColumn(statements):
+    # column of first token of line
+    return statements[0][1][0] if statements else 0
 
 #####################################################
-# CODE EXTRACTION
+# CODE REWRITING
 #####################################################
+def matchBlocks(lines):
+    # single scan over all statements with a stack of open blocks, returns dicts
+    # with for each line opening a block ('{' as last token) the line nr of the
+    # closing bracket '}' (-1 if not found) and of '}else{' on the same level
+    groupEnds={}
+    elseNrs={}
+    stack=[]                                    # [lineNr of opening statement, closable]
+    for lineNr,statements in enumerate(lines):
+        for tokens,columns in statements:
+            if "{" in tokens[1:-1] or "}" in tokens[1:-1]:     # brackets within statement, open blocks can not be closed
+                for block in stack: block[1]=False
+            closes=(tokens[0]=="}")
+            opens =(tokens[-1]=="{")
+            if closes and not opens:
+                if stack:
+                    openNr,closable=stack.pop()
+                    groupEnds[openNr]=lineNr if closable else -1
+            elif opens and not closes:
+                stack.append([lineNr,True])
+            elif tokens[0]=="}else{" and stack and stack[-1][0] not in elseNrs:
+                elseNrs[stack[-1][0]]=lineNr
+    for openNr,closable in stack:               # if nothing found we return -1 so rewrite macros can append error to stack
+        groupEnds[openNr]=-1
+    return groupEnds,elseNrs
+
+def rewriteMacros(lines,errorStack):
+    # rewrites statements of if/while/for blocks in lines to core statements
+    groupEnds,elseNrs=matchBlocks(lines)
+    for lineNr,statements in enumerate(lines):
+        statements=rewriteLine(lines,lineNr,statements,groupEnds,elseNrs,errorStack)
+        if statements is False: return False
+        lines[lineNr]=statements
+    return lines
+
+def rewriteLine(lines,lineNr,statements,groupEnds,elseNrs,errorStack):
+    # returns rewritten statements of line lineNr and rewrites the closing and else lines
+    # of its block in lines, returns False on errors
+    # the rewritten statements have the column of the macro statement or closing bracket
+    if statements:
+        tokens=statements[0][0]
+        columns=statements[0][1]
+        for statementTokens,statementColumns in statements[1:]:                # macro statement can not be followed by other statements
+            tokens=tokens+[";"]+statementTokens
+            columns=columns+[statementColumns[0]]+statementColumns
+        cmd=tokens[0]
+
+        if cmd=="if" and tokens[-1]=="{":
+            if len(tokens)!=3:  
+                logError(errorStack,lineNr,lineText(statements),None,f"SyntaxError: If statement has {('more','less')[len(tokens)<3]} tokens than expected.")
+                return False          
+            else:
+                jumpNr=groupEnds[lineNr]                                                        # find closing bracket
+                elseNr=elseNrs.get(lineNr,-1)
+                fndClosingBracket = (jumpNr>=0)
+                fndElse           = (elseNr>=0)
+                if fndClosingBracket:                                                           # if } found
+                    cond=tokens[1]
+                    if fndElse:
+                        statements=[(["if",f"not({cond})",str(elseNr+1)],columns)]
+                        elseColumn=lineColumn(lines[elseNr])
+                        lines[elseNr]=[(["goto",str(jumpNr)],[elseColumn]*2)]
+                    else:
+                        statements=[(["if",f"not({cond})",str(jumpNr)],columns)]
+                    lines[jumpNr]=[]
+                else:   
+                    logError(errorStack,lineNr,lineText(statements),None,f"SyntaxError: If statement is missing closing bracket {'}'}.")
+                    return False            
+        if cmd=="while":
+            if tokens[-1]!="{" or len(tokens)!=3:  
+                logError(errorStack,lineNr,lineText(statements),None,f"SyntaxError: While statement has {('more','less')[len(tokens)<3]} tokens than expected.")
+                return False          
+            else:
+                jumpNr=groupEnds[lineNr]                                                        # find closing bracket
+                fndClosingBracket = (jumpNr>=0)
+                if fndClosingBracket:                                                           # if } found
+                    cond=tokens[1]
+                    endColumn=lineColumn(lines[jumpNr])
+                    statements=[(["if",f"not({cond})",str(jumpNr)],columns)]
+                    lines[jumpNr]=[(["if",cond,str(lineNr)],[endColumn]*3)]
+                else:                                                                           # if } not found
+                    logError(errorStack,lineNr,lineText(statements),None,f"SyntaxError: While statement is missing closing bracket {'}'}.")
+                    return False            
+        if cmd=="for":
+            if tokens[-1]!="{" or (len(tokens)!=5 and len(tokens)!=6):  
+                logError(errorStack,lineNr,lineText(statements),None,f"SyntaxError: For statement has {('more','less')[len(tokens)<5]} tokens than expected.")
+                return False          
+            else:
+                tkVar  = tokens[1]
+                tkFrom = tokens[2]
+                tkTo   = tokens[3]
+                tkStep = tokens[4] if len(tokens)==6 else 1
+                jumpNr=groupEnds[lineNr]                                                        # find closing bracket
+                fndClosingBracket = (jumpNr>=0)
+                if fndClosingBracket:                                                           # if } found
+                    endColumn=lineColumn(lines[jumpNr])
+                    statements=[(["var",tkVar,tkFrom],columns[:3])]
+                    compare="<" if int(tkStep)>0 else ">"
+                    lines[jumpNr]=[([tkVar,f"{tkVar}+{tkStep}"],[endColumn]*2),
+                                   (["if",f"{tkVar}{compare}{tkTo}",str(lineNr+1)],[endColumn]*3)]
+                else:                                                                           # if } not found
+                    logError(errorStack,lineNr,lineText(statements),None,f"SyntaxError: For statement is missing closing bracket {'}'}.")
+                    return False  
+
+    return statements
 
-def multiSplit(strText,delimiters):
-    regular_exp = '|'.join(map(re.escape, delimiters))
-    return re.split(regular_exp, strText) 
 
-#https://stackoverflow.com/questions/2785755/how-to-split-but-ignore-separators-in-quoted-strings-in-python
-def statement2tokens(scriptline):
-    # remove remarks
-    scriptline=scriptline.strip()               
-    if len(scriptline)>0:
-        PATTERN_SPACES = re.compile(r'''((?:[^ "']|"[^"]*"|'[^']*')+)''')
-        tokens= PATTERN_SPACES.split(scriptline)[1::2]
-        return tokens
-    else:
-        return None
-
-def scriptline2statements(scriptline):
-    # remove remarks
-    if len(scriptline.strip())==0: return None
-    if scriptline.strip()[0]=='#': return None
-    if len(scriptline)>0:
-        PATTERN_SPACES = re.compile(r'''((?:[^;"']|"[^"]*"|'[^']*')+)''')
-        tokens= PATTERN_SPACES.split(scriptline)[1::2]
-        return tokens
-    else:
-        return None
+#####################################################
+# CODE EXTRACTION
+#####################################################
 
-def extractLabels(scriptlines,varis):
-    # create list of labels
-    lineNr=0
-    while lineNr<len(scriptlines):                  
-        tokens=statement2tokens(scriptlines[lineNr])
-        if tokens:
+def extractLabels(lines,varis,subEnds):
+    # yields statements of each line, while filling varis with the labels and subEnds
+    # with the line number of the matching return of each sub (-1 if not found)
+    openSubs=[]
+    for lineNr,statements in enumerate(lines):
+        yield statements
+        for tokens,columns in statements:
             cmd=tokens[0]
             nrArgs=len(tokens)-1
             if (cmd=="label" or cmd=="sub")  and nrArgs==1: 
                 labelName =tokens[1]
                 labelValue=lineNr
                 varis[labelName]=labelValue
-        lineNr+=1 
-    return varis
+            if cmd=="sub":
+                openSubs.append(lineNr)
+                subEnds[lineNr]=-1
+            elif cmd=="return" and openSubs:                # returns of labels called with gosub have no sub
+                subEnds[openSubs.pop()]=lineNr
+
+#####################################################
+# COMPILING
+#####################################################
+# The rewritten scriptlines are compiled once to a flat list of instructions
+#   (opcode, lineNr, statement, cmd, operands, target)
+# operands are constants or Expr objects which are evaluated at runtime.
+# target is the resolved instruction index of a jump with a constant line
+# number or label, otherwise None and the jump is resolved at runtime.
+
+OP_VAR   =0
+OP_SET   =1 # assignment of variable or call of system function, decided at runtime
+OP_LABEL =2
+OP_SUB   =3
+OP_GOTO  =4
+OP_GOSUB =5
+OP_RETURN=6
+OP_IF    =7
+OP_EXIT  =8
+OP_JUMP  =9 # jump without arguments to target, only made by optimizeProgram
+OP_LOOP  =10# fused loop test, made by fuseLoops
+
+coreCommands={'var'   :OP_VAR,
+              'label' :OP_LABEL,
+              'sub'   :OP_SUB,
+              'goto'  :OP_GOTO,
+              'gosub' :OP_GOSUB,
+              'return':OP_RETURN,
+              'if'    :OP_IF,
+              'exit'  :OP_EXIT,
+             }
+
+# expressions are compiled once to code objects, the cache is shared between scripts and reruns
+EXPRESSION_CACHE_SIZE=4096
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compileExpression(calcToken):
+    try:
+        return compile(calcToken,'<string>','eval')
+    except SyntaxError:
+        return calcToken    # eval on runtime will raise and log the same error
+
+class Expr:
+    # token which should be evaluated at runtime
+    __slots__=('source','code','column')
+    def __init__(self,source,code=None,column=None):
+        self.source=source
+        self.code=code if code is not None else compileExpression(source)
+        self.column=column  # column of token in scriptline, None if unknown
+
+class Program:
+    # compiled script
+    #   scriptlines : rewritten scriptlines (same line numbers as original)
+    #   labels      : label/sub name -> line number
+    #   subEnds     : line number of sub -> line number of matching return
+    #   instrs      : flat list of instructions
+    #   lineIndex   : line number -> index of first instruction on or after that line,
+    #                 last entry (len(scriptlines)) points past last instruction
+    #   optimized   : report of optimizeProgram or None
+    def __init__(self,scriptlines,labels,subEnds):
+        self.scriptlines=scriptlines
+        self.labels=labels
+        self.subEnds=subEnds
+        self.instrs=[]
+        self.lineIndex=[]
+        self.transpiled={}  # cache of transpiled blocks, see TranspiledBlocks
+        self.optimized=None # report of optimizeProgram if optimized
+        self.checks=None    # argument checks of instructions, made by buildChecks on first run
+
+    def lineToPc(self,lineNr):
+        if 0<=lineNr<len(self.lineIndex): return self.lineIndex[lineNr]
+        return len(self.instrs)
+
+def compileScript(scriptlines,errorStack,quitOnError=True):
+    # preprocess, returns None if errors found (and quitOnError)
+    nrErrors=len(errorStack)
+    lines=lexScript(scriptlines,errorStack)
+    if len(errorStack)>nrErrors and quitOnError: return None
+    if rewriteMacros(lines,errorStack) is False and quitOnError: return None
+    program=compileLines(Program([lineText(statements)+"\n" for statements in lines],{},{}),lines)
+    if not checkSubEnds(program,errorStack) and quitOnError: return None
+    return program
+
+def checkSubEnds(program,errorStack):
+    # returns False if a sub has no matching return
+    found=True
+    for subNr,returnNr in program.subEnds.items():
+        if returnNr<0:
+            logError(errorStack,subNr,program.scriptlines[subNr],None,f"SyntaxError: Sub statement is missing matching 'return' statement.")
+            found=False
+    return found
+
+def compileLines(program,lines):
+    # compiles the rewritten statements of each line to instructions of program,
+    # lines can be a generator, so they are read once
+    instrs=program.instrs
+    lineIndex=program.lineIndex
+    assigned=set()  # labels which are (re)assigned cannot be resolved on compile
+    jumps=[]        # instruction indices of jumps with possibly constant target and column of target
+    for lineNr,statements in enumerate(extractLabels(lines,program.labels,program.subEnds)):
+        lineIndex.append(len(instrs))
+        for tokens,columns in statements:
+            statement=" ".join(tokens)
+            cmd=tokens[0]
+            op=coreCommands.get(cmd,OP_SET)
+            if op==OP_VAR:
+                operands=tokens[1:2]+[Expr(token,column=column) for token,column in zip(tokens[2:],columns[2:])]
+                if len(tokens)>1: assigned.add(tokens[1])
+            elif op==OP_LABEL:
+                operands=tokens[1:]
+            elif ((op==OP_GOTO or op==OP_GOSUB or op==OP_SUB) and len(tokens)==2) or (op==OP_IF and len(tokens)==3):
+                operands=[Expr(token,column=column) for token,column in zip(tokens[1:-1],columns[1:-1])]+tokens[-1:]  # target is compiled after resolving
+                jumps.append((len(instrs),columns[-1]))
+            else:
+                operands=[Expr(token,column=column) for token,column in zip(tokens[1:],columns[1:])]
+                if op==OP_SET: assigned.add(cmd)
+            instrs.append((op,lineNr,statement,cmd,operands,None))
+    lineIndex.append(len(instrs))
+
+    # resolve jumps to literal line numbers and labels
+    for pc,column in jumps:
+        op,lineNr,statement,cmd,operands,target=instrs[pc]
+        token=operands[-1]
+        if token.isascii() and token.isdigit(): jumpLine=int(token)
+        elif token in program.labels and token not in assigned: jumpLine=program.labels[token]
+        else: jumpLine=None
+        operands[-1]=jumpLine if jumpLine is not None else Expr(token,column=column)
+        if op==OP_SUB:
+            # sub is skipped if not called with gosub
+            if program.subEnds.get(lineNr,-1)>=0: target=program.lineToPc(program.subEnds[lineNr]+1)
+        elif jumpLine is not None:
+            # goto/gosub continue after label, if continues on line
+            target=program.lineToPc(jumpLine if op==OP_IF else jumpLine+1)
+        instrs[pc]=(op,lineNr,statement,cmd,operands,target)
+
+    fuseLoops(instrs)
+    return program
+
+class LexedLines:
+    # statements of the lines of a script read on access, rewritten lines are kept until
+    # they are compiled, so rewriteLine can be used without lexing the whole script first
+    def __init__(self,scriptlines):
+        self.scriptlines=scriptlines
+        self.rewritten={}
+
+    def __getitem__(self,lineNr):
+        if lineNr in self.rewritten: return self.rewritten[lineNr]
+        return lexLine(self.scriptlines[lineNr])[0]
+
+    def __setitem__(self,lineNr,statements):
+        self.rewritten[lineNr]=statements
+
+def rewrittenLines(scriptlines,groupEnds,elseNrs,errorStack,quitOnError=True):
+    # yields rewritten statements of each line, each line is lexed again
+    lines=LexedLines(scriptlines)
+    rewriting=True
+    for lineNr,scriptline in enumerate(scriptlines):
+        statements=lines.rewritten.pop(lineNr,None)
+        if statements is None: statements=lexLine(scriptline)[0]
+        if rewriting:
+            rewritten=rewriteLine(lines,lineNr,statements,groupEnds,elseNrs,errorStack)
+            if rewritten is not False: statements=rewritten
+            elif quitOnError: return
+            else: rewriting=False          # like rewriteMacros, lines after an error are not rewritten
+        yield statements
+
+def compileScriptFile(scriptlines,errorStack,quitOnError=True):
+    # compiles like compileScript, but reads the lines twice (to match blocks and to compile)
+    # without keeping the text or tokens of all lines, so memory is bounded by the compiled
+    # program. The scriptlines of the program are the original lines.
+    nrErrors=len(errorStack)
+    groupEnds,elseNrs=matchBlocks(lexLines(scriptlines,errorStack))
+    if len(errorStack)>nrErrors and quitOnError: return None
+    program=compileLines(Program(scriptlines,{},{}),rewrittenLines(scriptlines,groupEnds,elseNrs,errorStack,quitOnError))
+    if len(errorStack)>nrErrors and quitOnError: return None
+    if not checkSubEnds(program,errorStack) and quitOnError: return None
+    return program
+
+# The closing line of a for loop 'i i+s ; if i<b L' and the test of a while loop
+# 'if i<b L' are fused to one OP_LOOP instruction which adds the step and compares
+# without evaluating strings if the variable and bound are numbers:
+#   (OP_LOOP, lineNr, statement, cmd, [name, step, compare, bound, *operands], target)
+# step is None for a test only. statement, cmd and operands are those of the
+# original assignment or if statement, which is run if the fast path does not apply.
+# If the assignment is fused, the if statement follows and is skipped by the fast path.
+COMPARES={ast.Lt:'<',ast.Gt:'>',ast.LtE:'<=',ast.GtE:'>=',ast.Eq:'==',ast.NotEq:'!='}
+COMPARE_FUNCTIONS={'<':operator.lt,'>':operator.gt,'<=':operator.le,'>=':operator.ge,'==':operator.eq,'!=':operator.ne}
+
+def parseLoopTest(operand):
+    # returns (name, compare, bound) of 'name<bound', None if operand is not such a test
+    if operand.__class__ is not Expr: return None
+    try:
+        node=ast.parse(operand.source.strip(),mode='eval').body
+    except SyntaxError:
+        return None
+    if node.__class__ is not ast.Compare or len(node.ops)!=1 or node.left.__class__ is not ast.Name: return None
+    if node.ops[0].__class__ not in COMPARES: return None
+    bound=node.comparators[0]
+    if bound.__class__ is ast.Constant and bound.value.__class__ in (int,float): bound=bound.value
+    else: bound=Expr(ast.unparse(bound),column=operand.column)
+    return node.left.id,COMPARES[node.ops[0].__class__],bound
+
+def parseLoopStep(name,operand):
+    # returns step of 'name+step' with integer step, None if operand is not such a step
+    if operand.__class__ is not Expr: return None
+    try:
+        node=ast.parse(operand.source.strip(),mode='eval').body
+    except SyntaxError:
+        return None
+    if node.__class__ is not ast.BinOp or node.op.__class__ is not ast.Add: return None
+    if node.left.__class__ is not ast.Name or node.left.id!=name: return None
+    step=node.right
+    negative=step.__class__ is ast.UnaryOp and step.op.__class__ in (ast.USub,ast.UAdd)
+    if negative: step,sign=step.operand,(-1 if step.op.__class__ is ast.USub else 1)
+    if step.__class__ is not ast.Constant or step.value.__class__ is not int: return None
+    return step.value*sign if negative else step.value
+
+def fuseLoops(instrs):
+    # replaces loop steps and tests in instrs by OP_LOOP instructions
+    for pc,(op,lineNr,statement,cmd,operands,target) in enumerate(instrs):
+        if op==OP_IF and target is not None and len(operands)==2:
+            test=parseLoopTest(operands[0])
+            if test: instrs[pc]=(OP_LOOP,lineNr,statement,cmd,[test[0],None,test[1],test[2]]+operands,target)
+        elif op==OP_SET and len(operands)==1 and pc+1<len(instrs):
+            nextOp,nextLineNr,nextStatement,nextCmd,nextOperands,nextTarget=instrs[pc+1]
+            if nextOp!=OP_IF or nextLineNr!=lineNr or nextTarget is None or len(nextOperands)!=2: continue
+            step=parseLoopStep(cmd,operands[0])
+            test=parseLoopTest(nextOperands[0])
+            if step is None or not test or test[0]!=cmd: continue
+            instrs[pc]=(OP_LOOP,lineNr,statement,cmd,[cmd,step,test[1],test[2]]+operands,nextTarget)
+
+def unfuseLoop(instr):
+    # returns original instruction of OP_LOOP instruction
+    op,lineNr,statement,cmd,operands,target=instr
+    if operands[1] is None: return (OP_IF,lineNr,statement,cmd,operands[4:],target)
+    return (OP_SET,lineNr,statement,cmd,operands[4:],None)
+
+#####################################################
+# ARRAYS
+#####################################################
+# Scripts make arrays of numbers with array(values) or zeros(n), e.g.
+#   var buf array([1,2,3])
+#   var s sum(buf*gain)
+# Arrays can be indexed, sliced, used in arithmetic with arrays of the same length
+# or numbers, passed to system functions and stored as system var. If numpy is
+# installed an Array is a numpy array and element-wise arithmetic and reductions
+# (sum, min, max, mean) run vectorized. Otherwise the numbers are stored in an
+# array.array and the operations loop over the elements.
+
+if numpy is not None:
+    Array=numpy.ndarray
+
+    def makeArray(values):
+        values=numpy.array(values)
+        if values.dtype.kind not in "biuf": raise TypeError(f"array can only contain numbers, not {values.dtype}")
+        return values
+
+    def makeZeros(n):
+        return numpy.zeros(n)
+
+    def reduceArray(values,reduction):
+        return reduction(values).item()                                     # numpy scalar to python number
+else:
+    class Array:
+        # array of numbers with element-wise arithmetic, used if numpy is not installed
+        __slots__=('data',)
+        __hash__=None       # arrays compare element-wise, like numpy arrays
+        def __init__(self,values):
+            values=list(values)
+            for value in values:
+                if value.__class__ not in (int,float,bool): raise TypeError(f"array can only contain numbers, not {type(value).__name__}")
+            self.data=pyarray.array('d' if float in map(type,values) else 'q',values)
+
+        def elementwise(self,other,operation):
+            if other.__class__ is Array:
+                if len(other.data)!=len(self.data): raise ValueError(f"arrays of length {len(self.data)} and {len(other.data)} can not be combined")
+                return Array(map(operation,self.data,other.data))
+            return Array([operation(value,other) for value in self.data])
+
+        def __add__(self,other)      : return self.elementwise(other,operator.add)
+        def __radd__(self,other)     : return self.elementwise(other,operator.add)
+        def __sub__(self,other)      : return self.elementwise(other,operator.sub)
+        def __rsub__(self,other)     : return self.elementwise(other,lambda a,b:b-a)
+        def __mul__(self,other)      : return self.elementwise(other,operator.mul)
+        def __rmul__(self,other)     : return self.elementwise(other,operator.mul)
+        def __truediv__(self,other)  : return self.elementwise(other,operator.truediv)
+        def __rtruediv__(self,other) : return self.elementwise(other,lambda a,b:b/a)
+        def __floordiv__(self,other) : return self.elementwise(other,operator.floordiv)
+        def __rfloordiv__(self,other): return self.elementwise(other,lambda a,b:b//a)
+        def __mod__(self,other)      : return self.elementwise(other,operator.mod)
+        def __rmod__(self,other)     : return self.elementwise(other,lambda a,b:b%a)
+        def __pow__(self,other)      : return self.elementwise(other,operator.pow)
+        def __rpow__(self,other)     : return self.elementwise(other,lambda a,b:b**a)
+        def __eq__(self,other)       : return self.elementwise(other,operator.eq)
+        def __ne__(self,other)       : return self.elementwise(other,operator.ne)
+        def __lt__(self,other)       : return self.elementwise(other,operator.lt)
+        def __le__(self,other)       : return self.elementwise(other,operator.le)
+        def __gt__(self,other)       : return self.elementwise(other,operator.gt)
+        def __ge__(self,other)       : return self.elementwise(other,operator.ge)
+        def __neg__(self)            : return Array([-value for value in self.data])
+        def __abs__(self)            : return Array([abs(value) for value in self.data])
+        def __len__(self)            : return len(self.data)
+        def __bool__(self):
+            if len(self.data)!=1: raise ValueError("the truth value of an array with more than one element is ambiguous")
+            return bool(self.data[0])
+        def __iter__(self)           : return iter(self.data)
+        def __getitem__(self,index):
+            if index.__class__ is slice: return Array(self.data[index])
+            return self.data[index]
+        def __repr__(self)           : return f"array({self.data.tolist()})"
+
+    def makeArray(values):
+        return Array(values)
+
+    def makeZeros(n):
+        return Array([0.0]*n)
+
+    def reduceArray(values,reduction):
+        return reduction(values.data)
+
+def arraySum(*args):
+    if len(args)==1 and args[0].__class__ is Array: return reduceArray(args[0],numpy.sum if numpy else builtins.sum)
+    return builtins.sum(*args)
+
+def arrayMin(*args,**kwargs):
+    if len(args)==1 and args[0].__class__ is Array: return reduceArray(args[0],numpy.min if numpy else builtins.min)
+    return builtins.min(*args,**kwargs)
+
+def arrayMax(*args,**kwargs):
+    if len(args)==1 and args[0].__class__ is Array: return reduceArray(args[0],numpy.max if numpy else builtins.max)
+    return builtins.max(*args,**kwargs)
+
+def arrayMean(values):
+    if values.__class__ is Array and numpy: return reduceArray(values,numpy.mean)
+    return builtins.sum(values)/len(values)
+
+# functions scripts can use in expressions, these hide the builtins with the same name
+SCRIPT_FUNCTIONS={'array':makeArray,'zeros':makeZeros,'sum':arraySum,'min':arrayMin,'max':arrayMax,'mean':arrayMean}
 
 #####################################################
 # CODE EVALUATION
@@ -314,221 +640,1866 @@ def tokenIsString(token):
 def strIsNumber(strEval):
     return strEval.replace('.','0').isdigit()
 '''
-def evalArgument(varis,calcToken,linenr):
+def evalArgument(namespace,varis,calcToken,linenr):
     try:
-        #print (f"{calcToken} -> {eval(calcToken,None,varis)}")
-        return eval(calcToken,None,varis)
+        #print (f"{calcToken} -> {eval(calcToken,namespace,varis)}")
+        return eval(calcToken,namespace,varis)
     except Exception as e:
         #print (f"Error evalStrArgument: {calcToken} is not a valid calculation.")   
         #print (f"       {e}")
         return ValueError(f"{e}")
 
-def evalStatement(tokens,varis,linenr):
-    args=[]             
-    cmd=tokens[0]                                
-    for tnr,token in enumerate(tokens[1:]):                            
-        if ((cmd!="var" or tnr>0) and               # if cmd='var' do not eval 1st arg (name), but do eval 2nd arg (initial value of var) 
-             cmd!="label"):                         # if cmd='label' first argument is name of label and should not be evaluated
-            args.append(evalArgument(varis,token,linenr))                  
-            #print (f"  {tokens[tnr+1]} -> {args[-1]}")
-        else: 
-            args.append(token)
-            #print (f"  raw {token}")
-    return args
+# types typeToken recognizes
+TOKEN_TYPES=(str,bool,int,float,bytes,Array)
+
+def compileCheck(allowedTypes,operands=None):
+    # returns function which is True if the types of args are allowed, only for args of exactly these types.
+    # If not it should be followed by checkArgs, which also allows subclasses and logs the error.
+    # With operands given, constant operands are checked now and the function is None if no check is needed.
+    if operands is not None and len(operands)!=len(allowedTypes): return lambda args:False
+    checks=[]
+    for k,types in enumerate(allowedTypes):
+        if operands is not None and operands[k].__class__ is not Expr:
+            if typeToken(operands[k]) not in types: return lambda args:False
+            continue
+        checks.append((k,frozenset(t for t in types if t in TOKEN_TYPES)))
+    if operands is not None and not checks: return None
+    nrArgs=len(allowedTypes)
+    if len(checks)==0: return lambda args:len(args)==nrArgs
+    if len(checks)==1:
+        (k0,types0),=checks
+        if operands is not None: return lambda args:args[k0].__class__ in types0
+        return lambda args:len(args)==nrArgs and args[k0].__class__ in types0
+    return lambda args:len(args)==nrArgs and all(args[k].__class__ in types for k,types in checks)
+
+class Signature(list):
+    # list of allowed types for each argument with precompiled check
+    def __init__(self,allowedTypes):
+        list.__init__(self,allowedTypes)
+        self.valid=compileCheck(allowedTypes)
+    def __reduce__(self):
+        return (Signature,(list(self),))                                    # check is made again on unpickle
+
+# allowed argument types of core commands
+ARGTYPES_VAR  =Signature([[str],[str,float,bool,int,bytes,Array],])
+ARGTYPES_SET  =Signature([[str,float,int,Array],])
+ARGTYPES_LABEL=Signature([[str],])
+ARGTYPES_JUMP =Signature([[int],])
+ARGTYPES_IF   =Signature([[bool],[int]])
+ARGTYPES_NONE =Signature([])
+ARGTYPES_PRINT=Signature([[bool,int,float,str,Array],])
+# allowed argument types for each core command, assignments and system functions are checked when run
+OP_ARGTYPES={OP_VAR:ARGTYPES_VAR,OP_LABEL:ARGTYPES_LABEL,OP_SUB:ARGTYPES_JUMP,OP_GOTO:ARGTYPES_JUMP,OP_GOSUB:ARGTYPES_JUMP,
+             OP_RETURN:ARGTYPES_NONE,OP_IF:ARGTYPES_IF,OP_EXIT:ARGTYPES_NONE}
 
 def typeToken(arg):
-    #this is run by runScipt/evalStatement after it did evalArgument on all rokens
+    #this is run by runProgram after it did evalArgument on all operands
     if isinstance(arg,str): return str
     if isinstance(arg,bool): return bool
     if isinstance(arg,int): return int
     if isinstance(arg,float): return float
     if isinstance(arg,bytes): return bytes
+    if isinstance(arg,Array): return Array
+    if numpy is not None and isinstance(arg,numpy.generic): return typeToken(arg.item())   # element of numpy array
     return None    
 
-def checkArgs(lineNr,statement,tokens,tAllowedTypes):
-    #this is run by runScipt/evalStatement after it did evalArgument on all rokens
+def buildChecks(program):
+    # precompiled argument checks for each instruction of program, None if no check is needed
+    checks=[]
+    for op,lineNr,statement,cmd,operands,target in program.instrs:
+        if op==OP_LOOP: op,lineNr,statement,cmd,operands,target=unfuseLoop((op,lineNr,statement,cmd,operands,target))
+        allowedTypes=ARGTYPES_SET if op==OP_SET else OP_ARGTYPES.get(op)
+        checks.append(compileCheck(allowedTypes,operands) if allowedTypes is not None else None)
+    program.checks=checks
+    return checks
+
+def signatureFromAnnotations(function):
+    # allowed types of each argument without default value from annotations of function,
+    # arguments without annotation or annotated with Any or object allow all types, float
+    # also allows int, of generics like list[int] only the type (list) is checked, string
+    # annotations (e.g. from 'from __future__ import annotations') are evaluated
+    try:
+        parameters=inspect.signature(function,eval_str=True).parameters.values()
+    except (TypeError,ValueError):
+        raise ValueError(f"Signature of {function} unknown, please specify list of allowed types for each argument.")
+    except Exception as e:
+        raise ValueError(f"Annotations of {function} can not be evaluated ({e}), please specify list of allowed types for each argument.")
+    allowedTypes=[]
+    for parameter in parameters:
+        if parameter.kind not in (parameter.POSITIONAL_ONLY,parameter.POSITIONAL_OR_KEYWORD) or parameter.default is not parameter.empty: continue
+        annotation=parameter.annotation
+        origin=typing.get_origin(annotation)
+        members=typing.get_args(annotation) if origin is typing.Union or origin is types.UnionType else (annotation,)  # also Optional
+        allowed=[]
+        for member in members:
+            origin=typing.get_origin(member)
+            if origin is not None: member=origin                            # e.g. list[int] allows lists
+            if member is not typing.Any and not isinstance(member,type):
+                raise ValueError(f"Annotation {annotation} of {function} is not supported, please specify list of allowed types for each argument.")
+            allowed.append(member)
+        if annotation is parameter.empty or typing.Any in allowed or object in allowed: allowed=list(TOKEN_TYPES)
+        if float in allowed and int not in allowed: allowed.append(int)
+        allowedTypes.append(allowed)
+    return allowedTypes
+
+def checkArgs(errorStack,lineNr,statement,tokens,tAllowedTypes):
+    #this is run by runProgram after it did evalArgument on all operands
     #print (f"checkArgs:{tokens} {tAllowedTypes}")
     if len(tokens)!=len(tAllowedTypes): 
-        logError(lineNr,statement,None,f"ArgError: {len(tokens)} tokens found, {len(tAllowedTypes)} needed.")
+        logError(errorStack,lineNr,statement,None,f"ArgError: {len(tokens)} tokens found, {len(tAllowedTypes)} needed.")
         return False
 
     for token,allowedTypeList in zip(tokens,tAllowedTypes):
         tokenType=typeToken(token)
         #print (f"{token}:{tokenType} ? {tAllowedTypes}")
         if not (tokenType in allowedTypeList):
-            logError(lineNr,statement,token,f"ArgError: {token} of type {tokenType}, allowed {allowedTypeList}.")
+            logError(errorStack,lineNr,statement,token,f"ArgError: {token} of type {tokenType}, allowed {allowedTypeList}.")
             return False
     
     return True
 
 #####################################################
-# USER FUNCTIONS
+# OPTIMIZING
+#####################################################
+# With setOptimizer() the compiled program is optimized before it is run:
+#   constant expressions are replaced by their value
+#   if statements with constant condition are removed or become a jump
+#   goto statements to constant lines become a jump, which skips the type check
+#   jumps to jumps go directly to the last jump of the chain
+#   label statements are removed
+#   instructions which can not be reached are removed (not for scripts with calculated jumps)
+# Instructions keep their line number, so errors are reported on the same line.
+# Skipped jumps and labels are not reported to the callback handler and have no delay.
+
+# opcodes of instructions evaluating constant operands python can fold
+FOLDABLE_OPS={'RESUME','NOP','CACHE','LOAD_CONST','RETURN_VALUE','RETURN_CONST','COMPARE_OP','IS_OP','CONTAINS_OP',
+              'UNARY_NOT','COPY','POP_TOP','JUMP_IF_FALSE_OR_POP','JUMP_IF_TRUE_OR_POP','POP_JUMP_IF_FALSE','POP_JUMP_IF_TRUE',
+              'POP_JUMP_FORWARD_IF_FALSE','POP_JUMP_FORWARD_IF_TRUE'}
+
+def foldExpression(expr):
+    # returns value of expression without variables, or expr itself if it is not constant
+    code=expr.code
+    if code.__class__ is str or code.co_names: return expr
+    if any(instr.opname not in FOLDABLE_OPS for instr in dis.get_instructions(code)): return expr
+    try:
+        value=eval(code,{},{})
+    except Exception:
+        return expr                                                         # error is reported on runtime
+    if value.__class__ not in (str,int,float,bool,bytes): return expr        # only immutable values
+    if value.__class__ is float and not math.isfinite(value): return expr    # repr can not be transpiled
+    return value
+
+def argsAlwaysValid(op,operands):
+    # True if operands are constants which pass checkArgs
+    allowedTypes=OP_ARGTYPES.get(op)
+    if allowedTypes is None or len(operands)!=len(allowedTypes): return False
+    return all(operand.__class__ is not Expr and typeToken(operand) in types for operand,types in zip(operands,allowedTypes))
+
+def optimizeProgram(program):
+    # optimizes instructions of program in place, returns dict of number of changes for each transformation
+    report={"constants folded":0,"branches removed":0,"branches made jumps":0,"gotos made jumps":0,
+            "labels removed":0,"jumps threaded":0,"unreachable removed":0,"jumps to next removed":0}
+    instrs=program.instrs
+    END=len(instrs)
+    removed=[False]*END
+
+    # fold constants and branches, drop labels
+    dynamic=False
+    for pc,(op,lineNr,statement,cmd,operands,target) in enumerate(instrs):
+        for k,operand in enumerate(operands):
+            if operand.__class__ is Expr:
+                operands[k]=foldExpression(operand)
+                if operands[k] is not operand: report["constants folded"]+=1
+        if (op==OP_GOTO or op==OP_GOSUB or op==OP_IF) and target is None: dynamic=True
+        if not argsAlwaysValid(op,operands): continue
+        if op==OP_LABEL:
+            removed[pc]=True
+            report["labels removed"]+=1
+        elif op==OP_IF and target is not None:
+            if operands[0]:
+                instrs[pc]=(OP_JUMP,lineNr,statement,cmd,[],target)
+                report["branches made jumps"]+=1
+            else:
+                removed[pc]=True
+                report["branches removed"]+=1
+        elif op==OP_GOTO and target is not None:
+            instrs[pc]=(OP_JUMP,lineNr,statement,cmd,[],target)
+            report["gotos made jumps"]+=1
+
+    def follow(target):
+        # returns first instruction which is executed when jumping to target and if jumps are skipped
+        seen=set()
+        jumped=False
+        while target<END and target not in seen:
+            seen.add(target)
+            if removed[target]: target+=1
+            elif instrs[target][0]==OP_JUMP:
+                target=instrs[target][5]
+                jumped=True
+            else: break
+        return target,jumped
+
+    # thread jumps
+    threaded=[]
+    for pc,(op,lineNr,statement,cmd,operands,target) in enumerate(instrs):
+        if target is None or removed[pc]: continue
+        newTarget,jumped=follow(target)
+        if jumped and newTarget!=target:
+            instrs[pc]=(op,lineNr,statement,cmd,operands,newTarget)
+            threaded.append(pc)
+
+    # remove unreachable instructions
+    if not dynamic:
+        reachable=[False]*END
+        todo=[0]
+        while todo:
+            pc=todo.pop()
+            if pc>=END or reachable[pc]: continue
+            reachable[pc]=True
+            op,lineNr,statement,cmd,operands,target=instrs[pc]
+            if removed[pc]: todo.append(pc+1)
+            elif op==OP_JUMP or op==OP_GOTO or op==OP_SUB:
+                if target is not None: todo.append(target)
+            elif op==OP_GOSUB: todo+=[target,program.lineToPc(lineNr+1)]   # return continues on next line
+            elif op==OP_IF or op==OP_LOOP: todo+=[pc+1,target]
+            elif op!=OP_RETURN and op!=OP_EXIT: todo.append(pc+1)
+        for pc in range(END):
+            if not reachable[pc] and not removed[pc]:
+                removed[pc]=True
+                report["unreachable removed"]+=1
+    report["jumps threaded"]=sum(not removed[pc] for pc in threaded)
+
+    # remove jumps to next instruction
+    for pc in range(END-1,-1,-1):
+        if not removed[pc] and instrs[pc][0]==OP_JUMP and follow(pc+1)[0]==instrs[pc][5]:
+            removed[pc]=True
+            report["jumps to next removed"]+=1
+
+    # renumber, removed instructions map to the next instruction which is kept
+    newPcs=[0]*(END+1)
+    kept=[]
+    for pc in range(END):
+        newPcs[pc]=len(kept)
+        if not removed[pc]: kept.append(instrs[pc])
+    newPcs[END]=len(kept)
+    program.instrs=[(op,lineNr,statement,cmd,operands,newPcs[target] if target is not None else None)
+                    for op,lineNr,statement,cmd,operands,target in kept]
+    program.lineIndex=[newPcs[pc] for pc in program.lineIndex]
+    return report
+
+#####################################################
+# TRANSPILING
 #####################################################
+# With runScript(backend="python") the compiled instructions are translated to
+# python source. Each block of instructions between jump targets becomes a
+# function which returns the pc of the next block, a block which jumps to its
+# own start loops within the function. Expressions are inlined with names
+# replaced by lookups in VarDict, which resolves names not in the script the
+# same way eval does, so output and errorStack match runProgram.
+# Transpiling a block costs far more than interpreting it a few times, so only
+# hot blocks are transpiled: a block is run by the interpreter until it is
+# entered for the TRANSPILE_HOT_HITS time. Long scripts which run once are then
+# hardly slower than on the interpreter, loops run as python functions.
+
+class VarDict(dict):
+    # variables of transpiled script, shared are the system vars and labels below the script variables.
+    # These are not copied into the script variables, so they stay out of varis and follow addSystemVar
+    shared={}
+    def __missing__(self,name):
+        try:
+            return self.shared[name]
+        except KeyError:
+            pass
+        if name in SCRIPT_FUNCTIONS: return SCRIPT_FUNCTIONS[name]
+        if name in globals(): return globals()[name]
+        if hasattr(builtins,name): return getattr(builtins,name)
+        raise NameError(f"name '{name}' is not defined")
+
+class VarisRewriter(ast.NodeTransformer):
+    # replaces names by lookups in V (the VarDict)
+    def visit_Name(self,node):
+        if isinstance(node.ctx,ast.Load):
+            lookup=ast.Subscript(value=ast.Name(id='V',ctx=ast.Load()),slice=ast.Constant(value=node.id),ctx=ast.Load())
+            return ast.copy_location(lookup,node)
+        return node
+
+# nodes with their own scope or assignments, expressions containing these are not inlined but evaluated
+SCOPED_NODES=(ast.Lambda,ast.ListComp,ast.SetComp,ast.DictComp,ast.GeneratorExp,ast.NamedExpr)
+
+# number of times a block is entered before it is transpiled
+TRANSPILE_HOT_HITS=8
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def inlineExpression(calcToken):
+    # returns python source of expression or None if it can not be inlined
+    try:
+        tree=ast.parse(calcToken.strip(),mode='eval')
+        for node in ast.walk(tree):
+            if isinstance(node,SCOPED_NODES): return None
+        source=f"({ast.unparse(VarisRewriter().visit(tree).body)})"
+        compile(source,'<string>','eval')
+        return source
+    except SyntaxError:
+        return None
 
-orgscriptlines=None
-callbackHandler=None
-
-def setErrorHandler(errorHandlerFunction):
-    global errorHandler
-    errorHandler=errorHandlerFunction
-
-def setCallbackHandler(callbackHandlerFunction):
-    global callbackHandler
-    callbackHandler=callbackHandlerFunction
-
-def setScript(scriptlinesList):
-    global orgscriptlines
-    # check if list
-    if not isinstance(scriptlinesList,list):
-            raise ValueError(f"scriptlinesList should be of type <class 'list'> containing strings of scriptlines. Got {type(scriptlinesList)}.")
-    # check if lines are all strings
-    for line in scriptlinesList:
-        if not isinstance(line,str):
-            raise ValueError(f"scriptlinesList should contain elements of type <class 'str'> containing strings of scriptlines. Got line with {type(line)}.")
-
-    orgscriptlines=scriptlinesList
-
-def loadScript(scriptpath):
-    with open(scriptpath, "r") as reader: # open file
-        setScript(reader.readlines())
-    return orgscriptlines
-
-def addSystemVar(varName,varValue):
-    systemVars[varName]=varValue
-
-def addSystemFunction(funcName,function,argTypeList):
-    systemDefs[funcName]=(function,argTypeList)
-
-linenr=0
-def stopScript():
-    global linenr
-    linenr=len(orgscriptlines)
-
-def runScript(scriptpath=None,delaytime=0, skipVarDelay=True):
-    global orgscriptlines
-    global errorStack
-    global linenr
-    # clear errorStack
-    errorStack=[]
-
-    # load script
-    if scriptpath!=None:
-        scriptlines=loadScript(scriptpath)
-        orgscriptlines=scriptlines
+def blockLeaders(program,instrs):
+    # returns dict with first instruction of each block and the end of that block
+    END=len(instrs)
+    leaders={0}
+    dynamic=False
+    for pc,(op,lineNr,statement,cmd,operands,target) in enumerate(instrs):
+        if op==OP_GOTO or op==OP_GOSUB or op==OP_IF or op==OP_JUMP:
+            if target is None: dynamic=True
+            else: leaders.add(target)
+        if op==OP_GOSUB: leaders.add(program.lineToPc(lineNr+1))             # return continues on next line
+        if op==OP_SUB and target is not None: leaders.add(target)
+        if op!=OP_VAR and op!=OP_SET and op!=OP_LABEL: leaders.add(pc+1)
+    if dynamic: leaders.update(program.lineIndex)                           # jumps to calculated line numbers
+    leaders=sorted(leader for leader in leaders if leader<END)
+    return dict(zip(leaders,leaders[1:]+[END]))
+
+class TranspiledBlocks:
+    # block factories of a program for one combination of delay and callback, see runTranspiled,
+    # blocks are transpiled when they get hot and are kept for next runs
+    def __init__(self,program,delayed=False,skipVarDelay=True,traced=False):
+        self.program=program
+        self.options=(delayed,skipVarDelay,traced)
+        self.instrs=[unfuseLoop(instr) if instr[0]==OP_LOOP else instr for instr in program.instrs]   # python compares fast enough
+        self.leaders=blockLeaders(program,self.instrs)
+        self.hits=dict.fromkeys(self.leaders,0)
+        self.factories={}
+        self.codes=[]       # code objects of expressions which are not inlined
+        self.lock=threading.Lock()
+
+    def factory(self,pc):
+        # returns factory of block starting at pc if it is transpiled or gets hot now, otherwise None
+        factory=self.factories.get(pc)
+        if factory is not None or pc not in self.hits: return factory
+        self.hits[pc]+=1
+        if self.hits[pc]<TRANSPILE_HOT_HITS: return None
+        with self.lock:     # threads of runMany share the program
+            if pc not in self.factories: self.factories[pc]=transpileBlock(self,pc)
+        return self.factories[pc]
+
+def transpileBlock(blocks,leader):
+    # returns factory which creates function of block starting at leader
+    instrs=blocks.instrs
+    codes=blocks.codes
+    delayed,skipVarDelay,traced=blocks.options
+    END=len(instrs)
+    blockEnd=blocks.leaders[leader]
+    body=[]
+    loops=False
+    prevLineNr=-1
+    for pc in range(leader,blockEnd):
+        op,lineNr,statement,cmd,operands,target=instrs[pc]
+        S=repr(statement)
+        body.append(f"# {lineNr+1:04}: {statement}")
+        if traced:
+            body.append(f"if I.stopRequested: return {pc}")              # stopped before this statement
+            if lineNr!=prevLineNr:
+                body+=[f"if last[0]!={lineNr}:",
+                       f"    last[0]={lineNr}",
+                       f"    callbackHandler({lineNr})"]
+        prevLineNr=lineNr
+
+        # evaluate operands
+        args=[f"a{k}" if operand.__class__ is Expr else repr(operand) for k,operand in enumerate(operands)]
+        exprs=[(k,operand) for k,operand in enumerate(operands) if operand.__class__ is Expr]
+        if len(exprs)>1: body.append("err=False")
+        for k,operand in exprs:
+            expr=inlineExpression(operand.source)
+            if expr is None:
+                expr=f"eval(CODES[{len(codes)}],namespace,V)"
+                codes.append(operand.code)
+            shown=S if operand.column is None else f"I.orgscriptlines[{lineNr}]"
+            body+=["try:",
+                  f"    a{k}={expr}",
+                   "except Exception as e:",
+                  f"    logError(errorStack,{lineNr},{shown},{operand.source!r},f\"EvalError: {{str(e).capitalize()}}\",{operand.column!r})",
+                  f"    {'err=True' if len(exprs)>1 else f'return {END}'}"]
+        if len(exprs)>1: body.append(f"if err: return {END}")
+        argList=f"[{','.join(args)}]"
+
+        def check(allowedName,allowedTypes):
+            # returns lines which check the types of arguments, None if check always fails
+            fail=[f"checkArgs(errorStack,{lineNr},{S},{argList},{allowedName})",f"return {END}"]
+            if len(operands)!=len(allowedTypes): return fail
+            conds=[]
+            for k,(operand,types) in enumerate(zip(operands,allowedTypes)):
+                if operand.__class__ is not Expr:
+                    if typeToken(operand) not in types: return fail
+                    continue
+                exact=['Array' if t is Array else t.__name__ for t in types if t in TOKEN_TYPES]
+                if not exact: conds.append("True")
+                else: conds.append(f"a{k}.__class__ not in ({','.join(exact)},)")
+            if not conds: return []
+            return [f"if ({' or '.join(conds)}) and not checkArgs(errorStack,{lineNr},{S},{argList},{allowedName}): return {END}"]
+
+        def jump(toPc):
+            nonlocal loops
+            if toPc==leader:
+                loops=True
+                return "continue"
+            return f"return {toPc}"
+
+        delay=["time.sleep(delaytime)"] if delayed and not (op==OP_VAR and skipVarDelay) else []
+        if op==OP_VAR:
+            body+=check("ARGTYPES_VAR",ARGTYPES_VAR)
+            if len(operands)==2: body.append(f"V[{operands[0]!r}]={args[1]}")
+            body+=delay
+        elif op==OP_SET:
+            body.append(f"if {cmd!r} in V or {cmd!r} in V.shared:")
+            body+=["    "+line for line in check("ARGTYPES_SET",ARGTYPES_SET)]
+            if len(operands)==1: body.append(f"    V[{cmd!r}]={args[0]}")
+            body+=["    "+line for line in delay]
+            body+=[f"elif {cmd!r} in systemDefs:",
+                   f"    functionH,allowedTypes=systemDefs[{cmd!r}]",
+                   f"    if not (allowedTypes.__class__ is Signature and allowedTypes.valid({argList})) and not checkArgs(errorStack,{lineNr},{S},{argList},allowedTypes): return {END}",
+                   f"    result=functionH({','.join(args)})",
+                    "    if result is not None and inspect.isawaitable(result): runAwaitable(result)"]
+            body+=["    "+line for line in delay]
+            body+=[f"    if I.stopRequested: return {pc+1}",
+                    "else:",
+                   f"    logError(errorStack,{lineNr},{S},{args[-1] if args else None},\"CmdError: Command '{cmd}'not valid.\")",
+                   f"    return {END}"]
+        elif op==OP_LABEL:
+            body+=check("ARGTYPES_LABEL",ARGTYPES_LABEL)+delay
+        elif op==OP_SUB:
+            body+=check("ARGTYPES_JUMP",ARGTYPES_JUMP)
+            if target is None: body.append(f"return {END}")             # missing return, reported on compile
+            else             : body+=delay+[jump(target)]
+        elif op==OP_GOTO or op==OP_GOSUB:
+            body+=check("ARGTYPES_JUMP",ARGTYPES_JUMP)
+            if op==OP_GOSUB: body.append(f"callStack.append({lineNr})")
+            body+=delay
+            body.append(jump(target) if target is not None else f"return lineToPc({args[0]}+1)")
+        elif op==OP_RETURN:
+            body+=check("ARGTYPES_NONE",ARGTYPES_NONE)
+            body+=["if not callStack:",
+                   f"    logError(errorStack,{lineNr},{S},None,\"SyntaxError: Return statement without matching 'gosub' statement.\")",
+                   f"    return {END}",
+                   "nextPc=lineToPc(callStack.pop()+1)"]
+            body+=delay+["return nextPc"]
+        elif op==OP_IF:
+            body+=check("ARGTYPES_IF",ARGTYPES_IF)+delay
+            if len(operands)==2:
+                body+=[f"if {args[0]}: {jump(target) if target is not None else f'return lineToPc({args[1]})'}"]
+        elif op==OP_EXIT:
+            body+=check("ARGTYPES_NONE",ARGTYPES_NONE)+[f"return {END}"]
+        elif op==OP_JUMP:
+            body+=delay+[jump(target)]
+    body.append(f"return {blockEnd}")
+
+    src=["def blockFactory(I,delaytime,lineToPc,CODES,last):",
+         "    errorStack,callStack,systemDefs,callbackHandler,namespace=I.errorStack,I.callStack,I.systemDefs,I.callbackHandler,I.namespace",
+        f"    def block{leader}(V):"]
+    if loops:
+        src+=["        while True:",
+             f"            if I.stopRequested: return {leader}"]
+        src+=["            "+line for line in body]
     else:
-        if orgscriptlines==None:  
+        src+=["        "+line for line in body]
+    src.append(f"    return block{leader}")
+    namespace={}
+    exec(compile("\n".join(src),f"<transpiled block {leader}>","exec"),globals(),namespace)
+    return namespace["blockFactory"]
+
+#####################################################
+# SCRIPT FILES
+#####################################################
+# Large script files are memory mapped (see Interpreter.loadScript) instead of read
+# with readlines. Only the offsets of the lines are kept in an array (8 bytes a line),
+# each line is decoded when it is read, so the text of the script is never held in
+# memory. Mapped scripts are compiled by compileScriptFile.
+
+MAP_SCRIPT_SIZE=64*1024*1024    # files of this size or larger are memory mapped by loadScript
+
+class ScriptFile:
+    # read only list of the lines of a memory mapped script file
+    def __init__(self,scriptpath,encoding="utf-8"):
+        self.scriptpath=scriptpath
+        self.encoding=encoding
+        self.offsets=pyarray.array('q',[0])
+        with open(scriptpath,"rb") as reader:
+            size=os.fstat(reader.fileno()).st_size
+            self.data=mmap.mmap(reader.fileno(),0,access=mmap.ACCESS_READ) if size else b""
+        if not size: return
+        readline=self.data.readline
+        tell=self.data.tell
+        append=self.offsets.append
+        while readline(): append(tell())
+        self.data.seek(0)
+
+    def __len__(self):
+        return len(self.offsets)-1
+
+    def __getitem__(self,lineNr):
+        if lineNr<0: lineNr+=len(self.offsets)-1
+        if not 0<=lineNr<len(self.offsets)-1: raise IndexError("script line out of range")
+        line=self.data[self.offsets[lineNr]:self.offsets[lineNr+1]].decode(self.encoding)
+        if line.endswith("\r\n"): line=line[:-2]+"\n"      # same as readlines of a file opened as text
+        return line
+
+    def __iter__(self):
+        for lineNr in range(len(self.offsets)-1):
+            yield self[lineNr]
+
+    def __reduce__(self):
+        # pickled as path, e.g. for process pools of runBatch
+        return (ScriptFile,(self.scriptpath,self.encoding))
+
+#####################################################
+# SCRIPT CACHE
+#####################################################
+# Compiled scripts can be cached on disk (see Interpreter.setScriptCache). A cache
+# file holds the marshalled program and a key, which is a hash of the source text,
+# the interpreter version, the optimizer setting and the python bytecode version.
+# Files with another key are ignored and overwritten, files are written to a temporary
+# file first and then renamed, so other processes never read a partly written file.
+# Optimized programs are cached in their own file (CACHE_OPT_EXT), so interpreters
+# with and without optimizer do not overwrite each other's cache.
+
+CACHE_FORMAT =3        # increase if format of instructions changes
+CACHE_EXT    =".pyic"
+CACHE_OPT_EXT=".opt.pyic"
+
+def scriptKey(scriptlines,optimized=False):
+    key=hashlib.sha256()
+    key.update(f"{VERSION}:{CACHE_FORMAT}:{optimized}:".encode()+importlib.util.MAGIC_NUMBER)
+    for line in scriptlines: key.update(line.encode('utf-8','surrogatepass'))
+    return key.hexdigest()
+
+def programToData(program):
+    # convert to types marshal can handle, Expr objects become tuples (source, code, column),
+    # scriptlines of a ScriptFile are not stored and set again by setScript
+    instrs=[(op,lineNr,statement,cmd,
+             tuple((operand.source,operand.code,operand.column) if operand.__class__ is Expr else operand for operand in operands),
+             target) for op,lineNr,statement,cmd,operands,target in program.instrs]
+    scriptlines=program.scriptlines if program.scriptlines.__class__ is list else None
+    return (scriptlines,program.labels,program.subEnds,instrs,program.lineIndex,program.optimized)
+
+def programFromData(data):
+    scriptlines,labels,subEnds,instrs,lineIndex,optimized=data
+    program=Program(scriptlines,labels,subEnds)
+    program.instrs=[(op,lineNr,statement,cmd,
+                     [Expr(*operand) if operand.__class__ is tuple else operand for operand in operands],
+                     target) for op,lineNr,statement,cmd,operands,target in instrs]
+    program.lineIndex=lineIndex
+    program.optimized=optimized
+    return program
+
+def readCachedProgram(cachePath,key):
+    # returns None if file is missing, unreadable or for other source/version
+    gcEnabled=gc.isenabled()
+    gc.disable()                # garbage collection would scan all new objects many times while loading
+    try:
+        with open(cachePath,"rb") as reader:
+            cacheKey,data=marshal.loads(reader.read())
+        if cacheKey!=key: return None
+        return programFromData(data)
+    except Exception:
+        return None
+    finally:
+        if gcEnabled: gc.enable()
+
+def writeCachedProgram(cachePath,key,program):
+    # write atomically, failing to write the cache is not an error
+    try:
+        cacheDir=os.path.dirname(cachePath)
+        os.makedirs(cacheDir,exist_ok=True)
+        fd,tmpPath=tempfile.mkstemp(dir=cacheDir,suffix=".tmp")
+        try:
+            with os.fdopen(fd,"wb") as writer:
+                marshal.dump((key,programToData(program)),writer)
+            os.replace(tmpPath,cachePath)
+        except BaseException:
+            os.unlink(tmpPath)
+            raise
+    except OSError:
+        pass
+
+#####################################################
+# CHECKPOINTS
+#####################################################
+# A script paused in step mode or stopped with stopScript can be saved with
+# Interpreter.checkpoint and resumed later, also in another process, with
+# resumeScript or startScript(checkpoint=...). A checkpoint holds the pc of the
+# next instruction, the callStack, the script variables and the key of the
+# script (see scriptKey), so it is refused for another script, interpreter
+# version or optimization. The format and key are a header in front of the
+# data and are checked before the data is read. The data is stored with marshal
+# and only holds the types script variables can have (see ARGTYPES_VAR), arrays
+# as lists of numbers. marshal does not run code, but is not made for crafted
+# data, so only load checkpoints from trusted sources.
+
+CHECKPOINT_MAGIC =b"PYICKPT"
+CHECKPOINT_FORMAT=2   # increase if content of checkpoints changes
+CHECKPOINT_TYPES =(str,float,bool,int,bytes)
+
+def checkCheckpointValue(value,name):
+    # raises ValueError if value can not be stored in (or was not made for) a checkpoint
+    if value.__class__ not in CHECKPOINT_TYPES:
+        raise ValueError(f"Variable '{name}' of type {type(value).__name__} can not be stored in a checkpoint.")
+
+def dumpCheckpoint(key,pc,callStack,varis):
+    values,arrays={},{}
+    for name,value in varis.items():
+        if value.__class__ is Array: arrays[name]=value.tolist() if numpy else value.data.tolist()
+        else:
+            if numpy is not None and isinstance(value,numpy.generic): value=value.item()   # element of numpy array
+            checkCheckpointValue(value,name)
+            values[name]=value
+    return CHECKPOINT_MAGIC+bytes([CHECKPOINT_FORMAT])+key.encode('ascii')+marshal.dumps((pc,list(callStack),values,arrays))
+
+def loadCheckpoint(data,key):
+    # returns (pc, callStack, variables), raises ValueError if checkpoint is unreadable or for another script
+    data=bytes(data)
+    header=CHECKPOINT_MAGIC+bytes([CHECKPOINT_FORMAT])
+    if not data.startswith(CHECKPOINT_MAGIC):
+        raise ValueError("Data is not a checkpoint.")
+    if not data.startswith(header):
+        raise ValueError(f"Checkpoint has format {data[len(CHECKPOINT_MAGIC)]}, expected {CHECKPOINT_FORMAT}.")
+    key=key.encode('ascii')
+    if data[len(header):len(header)+len(key)]!=key:
+        raise ValueError("Checkpoint was made for another script, interpreter version or optimization.")
+    try:
+        pc,callStack,values,arrays=marshal.loads(data[len(header)+len(key):])
+        if pc.__class__ is not int or any(lineNr.__class__ is not int for lineNr in callStack): raise ValueError("invalid pc or callStack")
+        for name,value in values.items(): checkCheckpointValue(value,name)
+        varis=dict(values)
+        for name,value in arrays.items():
+            if value.__class__ is not list: raise ValueError(f"array '{name}' is not a list")
+            varis[name]=makeArray(value)
+    except Exception as e:
+        raise ValueError(f"Checkpoint could not be read: {e}") from None
+    return pc,callStack,varis
+
+#####################################################
+# PROFILING
+#####################################################
+# With setProfiler() runScript runs the script with an instruction list which
+# notes the time each time runProgram fetches the next instruction, so the
+# normal run pays nothing for profiling. Rewritten macros keep the line numbers
+# of the original script, so the stats are per original line. Time while a script
+# is paused in step mode or gives other asyncio tasks a turn is not counted.
+
+class ProfiledInstrs(list):
+    # instructions which record hits, time and system function time for each line in stats
+    def __init__(self,instrs,stats):
+        list.__init__(self,instrs)
+        self.stats=stats
+        self.line=None                                                      # stats of running line
+        self.lastPc=-1
+        self.start=0
+    def __getitem__(self,pc):
+        now=time.perf_counter()
+        instr=list.__getitem__(self,pc)
+        if self.line is not None: self.line[1]+=now-self.start
+        lineNr=instr[1]
+        if lineNr not in self.stats: self.stats[lineNr]=[0,0.0,0.0]
+        line=self.stats[lineNr]
+        if line is not self.line or pc!=self.lastPc+1: line[0]+=1           # line entered (again)
+        self.line=line
+        self.lastPc=pc
+        self.start=time.perf_counter()
+        return instr
+    def pause(self):
+        if self.line is not None: self.line[1]+=time.perf_counter()-self.start
+    def resume(self):
+        self.start=time.perf_counter()
+    def stop(self):
+        self.pause()
+        self.line=None
+
+def profiledFunction(function,instrs):
+    # system function which adds its time to line running in instrs
+    def profiled(*args):
+        start=time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            if instrs.line is not None: instrs.line[2]+=time.perf_counter()-start
+    return profiled
+
+#####################################################
+# DEBUGGING
+#####################################################
+# With breakpoints, watchpoints or a trace set, scripts run with an instruction list
+# which checks these each time the next instruction is fetched, like the profiler,
+# so without them a run is not slowed down. Line numbers start at 1 as in the errors.
+# Changes of watched variables are found before the next instruction, so they are
+# reported with the line of the instruction which made them.
+
+MISSING=object() # value of watched variable which is not defined
+
+def valueChanged(old,new):
+    if old is new: return False
+    try:
+        return bool(old!=new)
+    except Exception:                                                       # e.g. numpy arrays of different length
+        return True
+
+def printDebugEvent(event,lineNr,detail,varis):
+    # default debug handler
+    if event=="break": print (f"Break {lineNr:04} > '{detail}'")
+    else             : print (f"Watch {lineNr:04} > {detail[0]}: {detail[1]!r} -> {detail[2]!r}")
+
+class DebugInstrs(list):
+    # instructions which add each fetched statement to trace, call handler on breakpoint lines
+    # and on changes of watched variables in varis or shared
+    def __init__(self,instrs,interpreter,varis):
+        list.__init__(self,instrs)
+        self.breakpoints=interpreter.breakpoints
+        self.watched={name:varis.get(name,interpreter.shared.get(name,MISSING)) for name in interpreter.watchpoints}
+        self.trace=interpreter.trace
+        self.handler=interpreter.debugHandler or printDebugEvent
+        self.varis=varis
+        self.shared=interpreter.shared
+        self.lineNr=-1
+        self.lastPc=-1
+    def __getitem__(self,pc):
+        instr=list.__getitem__(self,pc)
+        lineNr=instr[1]
+        if self.watched: self.checkWatches()
+        if self.trace is not None: self.trace.append((lineNr,instr[2]))
+        if lineNr in self.breakpoints and (lineNr!=self.lineNr or pc!=self.lastPc+1):
+            self.handler("break",lineNr+1,instr[2],self.varis)
+        self.lineNr=lineNr
+        self.lastPc=pc
+        return instr
+    def checkWatches(self):
+        varis=self.varis
+        for name,old in self.watched.items():
+            new=varis[name] if name in varis else self.shared.get(name,MISSING)
+            if valueChanged(old,new):
+                self.watched[name]=new
+                self.handler("watch",self.lineNr+1,(name,None if old is MISSING else old,None if new is MISSING else new),varis)
+    def stop(self):
+        if self.watched: self.checkWatches()                                # changes of last instruction
+
+def formatTrace(trace):
+    lines=[f"Trace of last {len(trace)} statements:"]
+    lines+=[f"{lineNr+1:04} > '{statement}'" for lineNr,statement in trace]
+    return "\n".join(lines)
+
+#####################################################
+# BATCH RUNS
+#####################################################
+# runBatch runs the loaded script once for each row of a parameter table, a list of
+# dicts with the values of system vars. If the rows differ only in numbers which never
+# decide a jump, and the script calls no system functions, the script runs once with a
+# numpy array of the values of all rows in place of each number. The variables are split
+# per row afterwards. The arrays hold python numbers (dtype object), so each element is
+# calculated as in a separate run, e.g. ints do not overflow and round gives ints.
+# Arrays of the script itself would broadcast against the arrays of the rows, so a script
+# which can make arrays, or has arrays as system var, is not run vectorized. Neither is a
+# script which indexes a row dependent value, takes an attribute of it or passes it to a
+# function other than round and abs, e.g. x[0] or len(x) would use the axis of the rows.
+# Otherwise, or if this single run reports an error, the rows run on their own in a
+# process pool, so the results are always those of separate runs.
+
+def codeNames(code):
+    # names used in code of expression, including those in lambdas and comprehensions
+    if code.__class__ is str: return set()                                  # syntax error, reported on runtime
+    names=set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const): names|=codeNames(const)
+    return names
+
+# names in expressions which can make arrays
+ARRAY_NAMES={'array','zeros','makeArray','makeZeros','Array','numpy','pyarray'}
+
+# nodes through which a row dependent value stays element-wise
+ROW_NODES=(ast.Expression,ast.BinOp,ast.UnaryOp,ast.Compare)
+
+def usesRowAxis(source,dependent):
+    # True if expression may use a row dependent name other than element-wise, see ROW_NODES
+    try:
+        tree=ast.parse(source.strip(),mode='eval')
+    except SyntaxError:
+        return False                                                        # reported on runtime
+    parents={}
+    for node in ast.walk(tree):
+        for child in ast.iter_child_nodes(node): parents[child]=node
+    for node in ast.walk(tree):
+        if node.__class__ is not ast.Name or node.id not in dependent: continue
+        while node in parents:
+            parent=parents[node]
+            if parent.__class__ is ast.Call:
+                if node is parent.func or parent.func.__class__ is not ast.Name or parent.func.id not in ROW_CALLS: return True
+            elif not isinstance(parent,ROW_NODES): return True
+            node=parent
+    return False
+
+def rowDependentVars(program,names,systemDefs):
+    # returns set of names and variables assigned from them, or None if they (may) decide
+    # a jump or are used other than element-wise, the script calls system functions or
+    # the script can make arrays
+    instrs=[unfuseLoop(instr) if instr[0]==OP_LOOP else instr for instr in program.instrs]
+    for op,lineNr,statement,cmd,operands,target in instrs:
+        if any(operand.__class__ is Expr and codeNames(operand.code)&ARRAY_NAMES for operand in operands): return None
+    dependent=set(names)
+    changed=True
+    while changed:
+        changed=False
+        for op,lineNr,statement,cmd,operands,target in instrs:
+            if op==OP_VAR and operands: name,values=operands[0],operands[1:]
+            elif op==OP_SET           : name,values=cmd,operands
+            else                      : continue
+            if name in dependent: continue
+            if any(value.__class__ is Expr and codeNames(value.code)&dependent for value in values):
+                dependent.add(name)
+                changed=True
+    for op,lineNr,statement,cmd,operands,target in instrs:
+        if op==OP_SET and cmd in systemDefs: return None
+        if op in (OP_IF,OP_GOTO,OP_GOSUB) and any(operand.__class__ is Expr and codeNames(operand.code)&dependent for operand in operands):
+            return None
+        if any(operand.__class__ is Expr and codeNames(operand.code)&dependent and usesRowAxis(operand.source,dependent) for operand in operands):
+            return None
+    return dependent
+
+def roundRows(number,ndigits=None):
+    # round of each row, the builtin round does not take arrays
+    if number.__class__ is Array: return numpy.frompyfunc(round,2,1)(number,ndigits)
+    return round(number,ndigits)
+
+# functions which replace those of the namespace in the vectorized run
+ROW_FUNCTIONS={'round':roundRows}
+# functions which take row dependent values
+ROW_CALLS={'round','abs'}
+
+def sweptNames(rows):
+    # names of system vars which differ between rows, None if rows can not be run vectorized
+    if numpy is None or len(rows)<2 or any(row.keys()!=rows[0].keys() for row in rows): return None
+    names=[]
+    for name,value in rows[0].items():
+        values=[row[name] for row in rows]
+        if value.__class__ in (int,float) and all(other.__class__ is value.__class__ for other in values):
+            if any(other!=value for other in values): names.append(name)
+        elif value.__class__ in (str,bool,bytes) and all(other.__class__ is value.__class__ for other in values):
+            if any(other!=value for other in values): return None
+        elif any(other is not value for other in values): return None
+    return names
+
+def ignoreErrors(errorStack):
+    pass
+
+batchInterpreter=None # interpreter of process in pool of runBatch
+
+def initBatchWorker(scriptlines,systemVars,systemDefs,optimize):
+    global batchInterpreter
+    batchInterpreter=Interpreter()
+    batchInterpreter.systemDefs=systemDefs
+    batchInterpreter.optimize=optimize
+    batchInterpreter.errorHandler=ignoreErrors
+    batchInterpreter.setScript(scriptlines)
+    batchInterpreter.systemVars=systemVars
+
+def runBatchRow(row):
+    return batchInterpreter.runRow(row)
+
+#####################################################
+# OUTPUT
+#####################################################
+# With setOutput() print does not write each line to stdout, but collects the lines
+# and writes them in batches. The lines are written after bufferSize lines, at most
+# flushInterval seconds after the first line of a batch was printed (by a timer thread,
+# so also while the script waits in a system function or runs without printing) and at
+# the end of each run, also on exit, errors and stopScript. Clones (e.g. of runMany)
+# share the sink and the timer and stopScript write from other threads, so the buffer
+# is guarded by a lock.
+
+OUTPUT_BUFFER_SIZE   =1000 # lines
+OUTPUT_FLUSH_INTERVAL=1.0  # seconds
+
+class OutputSink:
+    # target is a list to append lines to, a function which gets a list of lines,
+    # a file object or a path of a file to write to
+    def __init__(self,target,bufferSize=OUTPUT_BUFFER_SIZE,flushInterval=OUTPUT_FLUSH_INTERVAL):
+        self.file=None
+        self.ownFile=False
+        if isinstance(target,list): self.write=target.extend
+        elif callable(target)     : self.write=target
+        else:
+            if isinstance(target,(str,os.PathLike)):
+                target=open(target,"w",buffering=1<<20)
+                self.ownFile=True
+            self.file=target
+            self.write=self.writeFile
+        self.bufferSize=bufferSize
+        self.flushInterval=flushInterval
+        self.lines=[]
+        self.timer=None     # flushes the lines after flushInterval, started by the first line of a batch
+        self.lock=threading.RLock()
+
+    def print(self,value):
+        line=str(value)
+        with self.lock:
+            self.lines.append(line)
+            if len(self.lines)>=self.bufferSize: self.flush()
+            elif self.timer is None:
+                self.timer=threading.Timer(self.flushInterval,self.flush)
+                self.timer.daemon=True
+                self.timer.start()
+
+    def writeFile(self,lines):
+        self.file.write("\n".join(lines)+"\n")
+
+    def flush(self):
+        with self.lock:     # lines are written in the order they were printed
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer=None
+            lines,self.lines=self.lines,[]
+            if lines: self.write(lines)
+            if self.file: self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            if self.ownFile: self.file.close()
+
+#####################################################
+# INTERPRETER
+#####################################################
+# number of instructions runScriptAsync runs before giving other tasks a turn
+ASYNC_SLICE_SIZE=1000
+
+def runAwaitable(awaitable):
+    # wait for coroutine system function called by runScript
+    async def wait():
+        return await awaitable
+    return asyncio.run(wait())
+
+
+class Interpreter:
+    # interpreter with its own script, variables, call stack, errors and handlers,
+    # so several scripts can run at the same time (e.g. in threads)
+    def __init__(self):
+        self.errorHandler=None
+        self.callbackHandler=None
+        self.quitOnError=True # needed for debugging error messages
+        self.orgscriptlines=None
+        self.program=None
+        self.compileErrors=[]
+        self.stopRequested=False
+        self.stopped=False           # True if last run was stopped by stopScript before its end
+        self.useCache=False
+        self.cacheDir=None
+        self.profiling=False
+        self.profile={}              # line number (starting at 1) -> stats of last profiled run
+        self.profiled=None           # (instructions, system functions) of running profiled program
+        self.breakpoints=frozenset() # line numbers (starting at 0) of breakpoints
+        self.watchpoints=()
+        self.traceSize=0
+        self.trace=None              # last executed (lineNr, statement) of last debugged run
+        self.debugHandler=None
+        self.debugged=None           # instructions of running debugged program
+        self.optimize=False
+        self.varis=None
+        self.execution=None
+        self.pc=None                 # pc of next instruction of paused or stopped script, see checkpoint
+        self.programKey=None         # key of loaded script, see checkpoint
+        self.shared={}
+        self.output=None
+        self.clear()
+
+    def clear(self):
+        # FOLLOWING VARS, SYSTEM FUNCTIONS can be called from scipt
+        self.systemVars={'version':VERSION}
+        self.namespace=None # system vars and labels for eval, made on first run, see buildLayers
+        self.systemDefs={'print'  :(print,ARGTYPES_PRINT),}
+        if self.output: self.output.close()
+        self.output=None    # sink for print, see setOutput
+        self.callStack=[]
+        self.errorStack=[]
+
+    def clone(self):
+        # new interpreter with same system vars, system functions and handlers, but without script
+        interpreter=Interpreter()
+        interpreter.systemVars=self.systemVars.copy()
+        interpreter.systemDefs=self.systemDefs.copy()
+        interpreter.errorHandler=self.errorHandler
+        interpreter.callbackHandler=self.callbackHandler
+        interpreter.quitOnError=self.quitOnError
+        interpreter.useCache=self.useCache
+        interpreter.cacheDir=self.cacheDir
+        interpreter.profiling=self.profiling
+        interpreter.optimize=self.optimize
+        interpreter.output=self.output  # print of systemDefs writes to it
+        return interpreter
+
+    def printErrorStack(self):
+        if not self.errorHandler:
+            if self.errorStack:
+                print ("Errors found:")
+                for error in self.errorStack:
+                    print (error)
+                    print ('\n')
+        else:
+            self.errorHandler(self.errorStack)            
+
+    def setErrorHandler(self,errorHandlerFunction):
+        self.errorHandler=errorHandlerFunction
+
+    def setCallbackHandler(self,callbackHandlerFunction):
+        self.callbackHandler=callbackHandlerFunction
+
+    def setProfiler(self,enabled=True):
+        # record hits, time and system function time of each line in profile on runScript,
+        # runScriptAsync and startScript (at the end of the script)
+        self.profiling=enabled
+
+    def profileReport(self,sortBy="time",top=None):
+        # returns profile of last run as text, sorted on 'time', 'hits', 'systemTime' or 'line'
+        if sortBy not in ("time","hits","systemTime","line"):
+            raise ValueError(f"Unknown sortBy '{sortBy}', should be 'time', 'hits', 'systemTime' or 'line'.")
+        lineNrs=sorted(self.profile)
+        if sortBy!="line": lineNrs.sort(key=lambda lineNr:self.profile[lineNr][sortBy],reverse=True)
+        total=sum(stats["time"] for stats in self.profile.values()) or 1
+        report=[f"{'line':>6} {'hits':>10} {'time ms':>10} {'%':>6} {'system ms':>10}  source"]
+        for lineNr in lineNrs[:top]:
+            stats=self.profile[lineNr]
+            source=self.orgscriptlines[lineNr-1].rstrip() if self.orgscriptlines and lineNr<=len(self.orgscriptlines) else ""
+            report.append(f"{lineNr:6} {stats['hits']:10} {stats['time']*1e3:10.3f} {stats['time']/total*100:6.1f} {stats['systemTime']*1e3:10.3f}  {source}")
+        return "\n".join(report)
+
+    def setBreakpoints(self,lineNrs=()):
+        # line numbers (starting at 1) on which the debug handler is called before the line runs
+        self.breakpoints=frozenset(lineNr-1 for lineNr in lineNrs)
+
+    def setWatchpoints(self,names=()):
+        # variables on which changes the debug handler is called
+        self.watchpoints=tuple(names)
+
+    def setTrace(self,size=100):
+        # keep last size executed statements in trace, which is added to errorStack on errors, 0 turns trace off
+        self.traceSize=size
+
+    def setDebugHandler(self,debugHandlerFunction):
+        # function(event,lineNr,detail,varis) called on breakpoints with event 'break' and the statement as detail,
+        # and on changes of watched variables with event 'watch' and (name,oldValue,newValue) as detail
+        self.debugHandler=debugHandlerFunction
+
+    @property
+    def debugging(self):
+        # True if scripts run with debug instructions, these always run on the interpreter backend
+        return bool(self.breakpoints or self.watchpoints or self.traceSize)
+
+    def runningProgram(self,varis):
+        # loaded program, or a copy of it which is profiled or debugged
+        if self.profiling : return self.profileProgram(self.program)
+        if self.debugging : return self.debugProgram(self.program,varis)
+        return self.program
+
+    def debugProgram(self,program,varis):
+        # copy of program with instructions which check breakpoints, watchpoints and trace
+        self.trace=collections.deque(maxlen=self.traceSize) if self.traceSize else None
+        debugged=copy.copy(program)
+        debugged.instrs=self.debugged=DebugInstrs(program.instrs,self,varis)
+        return debugged
+
+    def setOptimizer(self,enabled=True):
+        # optimize scripts on setScript/loadScript, see optimizeProgram
+        self.optimize=enabled
+
+    @property
+    def optimizeReport(self):
+        # number of changes of each optimization of loaded script, None if not optimized
+        return self.program.optimized if self.program else None
+
+    def setScriptCache(self,enabled=True,cacheDir=None):
+        # cache compiled scripts in cacheDir, or if None in __pycache__ next to each loaded script file
+        self.useCache=enabled
+        self.cacheDir=cacheDir
+
+    def scriptCachePath(self,key,scriptpath=None):
+        if not self.useCache: return None
+        extension=CACHE_OPT_EXT if self.optimize else CACHE_EXT
+        if self.cacheDir: return os.path.join(self.cacheDir,key+extension)
+        if scriptpath:
+            folder,filename=os.path.split(os.path.abspath(scriptpath))
+            return os.path.join(folder,"__pycache__",filename+extension)
+        return None
+
+    def setScript(self,scriptlinesList,scriptpath=None):
+        # scriptlinesList is a list of strings or a ScriptFile, which is not checked line by line
+        mapped=isinstance(scriptlinesList,ScriptFile)
+        # check if list
+        if not isinstance(scriptlinesList,list) and not mapped:
+                raise ValueError(f"scriptlinesList should be of type <class 'list'> containing strings of scriptlines. Got {type(scriptlinesList)}.")
+        # check if lines are all strings
+        for line in (() if mapped else scriptlinesList):
+            if not isinstance(line,str):
+                raise ValueError(f"scriptlinesList should contain elements of type <class 'str'> containing strings of scriptlines. Got line with {type(line)}.")
+
+        self.orgscriptlines=scriptlinesList
+        self.namespace=None
+        self.programKey=None
+        self.pc=None
+        # compile once, errors are kept and reported on each runScript
+        self.errorStack=[]
+        self.compileErrors=self.errorStack
+        cachePath=None
+        if self.useCache:
+            key=self.programKey=scriptKey(scriptlinesList,self.optimize)
+            cachePath=self.scriptCachePath(key,scriptpath)
+        if cachePath:
+            self.program=readCachedProgram(cachePath,key)
+            if self.program:
+                if self.program.scriptlines is None: self.program.scriptlines=scriptlinesList
+                return
+        compile=compileScriptFile if mapped else compileScript
+        self.program=compile(scriptlinesList,self.errorStack,self.quitOnError)
+        if self.optimize and self.program: self.program.optimized=optimizeProgram(self.program)
+        # only scripts without errors are cached
+        if cachePath and self.program and not self.errorStack:
+            writeCachedProgram(cachePath,key,self.program)
+
+    def loadScript(self,scriptpath,mapped=None):
+        # mapped: memory map the file instead of reading it, by default for files of MAP_SCRIPT_SIZE or larger
+        if mapped is None: mapped=os.path.getsize(scriptpath)>=MAP_SCRIPT_SIZE
+        if mapped:
+            self.setScript(ScriptFile(scriptpath),scriptpath)
+            return self.orgscriptlines
+        with open(scriptpath, "r") as reader: # open file
+            self.setScript(reader.readlines(),scriptpath)
+        return self.orgscriptlines
+
+    def warmScriptCache(self,directory,extension=".pyi"):
+        # compile and cache all scripts in directory and its subdirectories,
+        # returns list of scripts with compile errors
+        failed=[]
+        interpreter=self.clone()
+        interpreter.useCache=True
+        for folder,dirnames,filenames in os.walk(directory):
+            dirnames[:]=[dirname for dirname in dirnames if dirname!="__pycache__"]
+            for filename in sorted(filenames):
+                if not filename.endswith(extension): continue
+                interpreter.loadScript(os.path.join(folder,filename))
+                if interpreter.compileErrors: failed.append(os.path.join(folder,filename))
+        return failed
+
+    def addSystemVar(self,varName,varValue):
+        self.systemVars[varName]=varValue
+        if self.namespace is None: return
+        self.shared.maps[1][varName]=varValue
+        if varName in self.program.labels: warnShadowed([varName])          # label hides system var
+        else: self.namespace[varName]=varValue
+
+    @property
+    def shadowedVars(self):
+        # names of system vars which are hidden by a label or sub of the loaded script
+        if self.program is None: return []
+        return sorted(self.program.labels.keys()&self.systemVars.keys())
+
+    def addSystemFunction(self,funcName,function,argTypeList=None):
+        # without argTypeList the allowed types are taken from the annotations of function
+        if argTypeList is None: argTypeList=signatureFromAnnotations(function)
+        self.systemDefs[funcName]=(function,Signature(argTypeList))
+
+    def stopScript(self):
+        self.stopRequested=True
+        if self.output: self.output.flush()
+
+    def setOutput(self,target=None,bufferSize=OUTPUT_BUFFER_SIZE,flushInterval=OUTPUT_FLUSH_INTERVAL):
+        # send output of print to target, see OutputSink, or with None directly to stdout
+        if self.output: self.output.close()
+        self.output=OutputSink(target,bufferSize,flushInterval) if target is not None else None
+        self.systemDefs['print']=(self.output.print if self.output else print,ARGTYPES_PRINT)
+
+    def runProgram(self,program,varis,delaytime=0,skipVarDelay=True,pc=0):
+        for pause in self.executeProgram(program,varis,delaytime,skipVarDelay,pc):
+            if pause.__class__ is int or pause.__class__ is float: time.sleep(pause)
+            else                                               : runAwaitable(pause)
+
+    def executeProgram(self,program,varis,delaytime=0,skipVarDelay=True,pc=0,sliceSize=None,last=None):
+        # generator which runs program and yields to its caller: the delaytime to wait, awaitables returned by
+        # system functions to wait for and, if sliceSize is given, None after each sliceSize instructions.
+        # The number of instructions to run until the next None can also be sent to the generator.
+        # last is a list with the line of the last callback, shared with transpiled blocks.
+        budget=-1 if sliceSize is None else sliceSize
+        errorStack=self.errorStack
+        callStack=self.callStack
+        systemDefs=self.systemDefs
+        callbackHandler=self.callbackHandler
+        instrs=program.instrs
+        checks=program.checks if program.checks is not None else buildChecks(program)
+        shared=self.shared
+        namespace=self.namespace
+        nrInstrs=len(instrs)
+        lastLineNr=last[0] if last else -1
+        self.pc=None
+        while pc<nrInstrs and not self.stopRequested:                       # follow instructions until last instruction
+            if not budget:
+                self.pc=pc
+                budget=(yield None) or sliceSize
+                self.pc=None
+            budget-=1
+            op,lineNr,statement,cmd,operands,target=instrs[pc]
+            check=checks[pc]
+            pc+=1
+            if callbackHandler and lineNr!=lastLineNr: 
+                callbackHandler(lineNr)
+                lastLineNr=lineNr
+                if last: last[0]=lineNr
+
+            # fast path of fused loop, see fuseLoops
+            if op==OP_LOOP:
+                name,step,compare,bound=operands[0],operands[1],operands[2],operands[3]
+                value=varis.get(name)
+                if value.__class__ is int or value.__class__ is float:
+                    if step is not None:
+                        value+=step
+                        varis[name]=value                                   # if statement follows if bound is no number
+                        if delaytime: yield delaytime
+                    if bound.__class__ is Expr: bound=evalArgument(namespace,varis,bound.code,lineNr)
+                    if bound.__class__ is int or bound.__class__ is float:
+                        if COMPARE_FUNCTIONS[compare](value,bound): pc=target
+                        elif step is not None: pc+=1                        # skip if statement
+                        if delaytime: yield delaytime
+                        continue
+                    if step is not None: continue
+                op,operands=(OP_IF if step is None else OP_SET),operands[4:]
+
+            # convert operands to evaluated arguments
+            args=[evalArgument(namespace,varis,operand.code,lineNr) if operand.__class__ is Expr else operand for operand in operands]
+            # handle evaluation errors
+            errors=0
+            for operand,arg in zip(operands,args):
+                if arg.__class__ is ValueError:
+                    shown=statement if operand.column is None else self.orgscriptlines[lineNr]
+                    logError(errorStack,lineNr,shown,operand.source,f"EvalError: {arg.args[0].capitalize()}",operand.column)
+                    errors+=1
+            if errors: break
+
+            # check types of arguments, check is None if types are already checked on compile
+            if check is not None and op!=OP_SET and not check(args):
+                if not checkArgs(errorStack,lineNr,statement,args,OP_ARGTYPES[op]): break
+
+            # handle command
+            if op==OP_VAR:
+                varis[args[0]]=args[1]                                      # add variable to variable list
+            elif op==OP_SET:
+                if cmd in varis or cmd in shared:
+                    if check is not None and not check(args) and not checkArgs(errorStack,lineNr,statement,args,ARGTYPES_SET): break
+                    varis[cmd]=args[0]                                      # change value of variable 
+                elif cmd in systemDefs:
+                    functionH,allowedTypes=systemDefs[cmd]
+                    if not (allowedTypes.__class__ is Signature and allowedTypes.valid(args)):
+                        if not checkArgs(errorStack,lineNr,statement,args,allowedTypes): break
+                    result=functionH(*args)                                 # call external function
+                    if result is not None and inspect.isawaitable(result): yield result
+                else:
+                    logError(errorStack,lineNr,statement,args[-1] if args else None,f"CmdError: Command '{cmd}'not valid.")
+                    break
+            elif op==OP_LABEL:
+                pass                                                        # already handled in extractLabels
+            elif op==OP_SUB:
+                if target is None: break                                    # missing return, reported on compile
+                pc=target                                                   # skip sub body if not called with gosub
+            elif op==OP_GOTO:
+                pc=target if target is not None else program.lineToPc(args[0]+1)  # continue after line associated with label
+            elif op==OP_GOSUB:
+                callStack.append(lineNr)
+                pc=target if target is not None else program.lineToPc(args[0]+1)
+            elif op==OP_RETURN:
+                if not callStack:
+                    logError(errorStack,lineNr,statement,None,f"SyntaxError: Return statement without matching 'gosub' statement.")
+                    break
+                pc=program.lineToPc(callStack.pop()+1)
+            elif op==OP_IF:
+                if args[0]: pc=target if target is not None else program.lineToPc(args[1])
+            elif op==OP_EXIT:
+                break
+            elif op==OP_JUMP:
+                pc=target
+
+            #if we have no remark line we wait for delay so user can keep up.      
+            if delaytime and not (op==OP_VAR and skipVarDelay):
+                yield delaytime
+
+        if self.stopRequested and pc<nrInstrs:
+            self.pc=pc                                                      # stopped script can be resumed from checkpoint
+            self.stopped=True
+
+    def profileProgram(self,program):
+        # copy of program with instructions, and system functions, which record stats per line, see endProfile
+        profiled=copy.copy(program)
+        profiled.instrs=ProfiledInstrs(program.instrs,{})
+        systemDefs=self.systemDefs
+        self.systemDefs={name:(profiledFunction(function,profiled.instrs),allowedTypes) for name,(function,allowedTypes) in systemDefs.items()}
+        self.profiled=(profiled.instrs,systemDefs)
+        return profiled
+
+    def endProfile(self):
+        # restore system functions and put stats of profiled program in profile, with line numbers
+        # starting at 1 as in errors, profileReport and setBreakpoints
+        instrs,self.systemDefs=self.profiled
+        self.profiled=None
+        instrs.stop()
+        self.profile={lineNr+1:{"hits":hits,"time":duration,"systemTime":systemTime} for lineNr,(hits,duration,systemTime) in instrs.stats.items()}
+
+    def runProfiled(self,program,varis,delaytime=0,skipVarDelay=True):
+        # run program with instructions and system functions which record stats per line in profile
+        profiled=self.profileProgram(program)
+        try:
+            self.runProgram(profiled,varis,delaytime,skipVarDelay)
+        finally:
+            self.endProfile()
+
+    def runTranspiled(self,program,varis,delaytime=0,skipVarDelay=True):
+        # transpiled blocks are kept for each combination of delay and callback
+        key=(bool(delaytime),skipVarDelay or not delaytime,self.callbackHandler is not None)
+        if key not in program.transpiled:
+            program.transpiled[key]=TranspiledBlocks(program,*key)
+        transpiled=program.transpiled[key]
+        last=[-1]                                                           # line of last callback
+        factoryArgs=(self,delaytime,program.lineToPc,transpiled.codes,last)
+        blocks={}
+        V=VarDict(varis)
+        V.shared=self.shared
+        nrInstrs=len(program.instrs)
+        pc=0
+        try:
+            while pc<nrInstrs and not self.stopRequested:
+                block=blocks.get(pc)
+                if block is None:
+                    factory=transpiled.factory(pc)
+                    if factory is None:
+                        pc=self.runUntilHot(program,V,delaytime,skipVarDelay,pc,transpiled,last)
+                        continue
+                    block=blocks[pc]=factory(*factoryArgs)
+                pc=block(V)
+        finally:
+            varis.update(V)                                                 # final values in varis, as on the interpreter
+        if pc<nrInstrs: self.stopped=True                                   # blocks return the pc where they were stopped
+        self.pc=None                                                        # variables of V can not be checkpointed
+
+    def runUntilHot(self,program,varis,delaytime,skipVarDelay,pc,transpiled,last):
+        # run program with the interpreter from pc until it enters a transpiled or hot block, returns pc of that block
+        execution=self.executeProgram(program,varis,delaytime,skipVarDelay,pc,1,last)
+        for pause in execution:
+            if pause is None:
+                pc=self.pc
+                if transpiled.factory(pc) is not None:
+                    execution.close()
+                    return pc
+            elif pause.__class__ is int or pause.__class__ is float: time.sleep(pause)
+            else                                                   : runAwaitable(pause)
+        return self.pc if self.pc is not None else len(program.instrs)      # pc where it was stopped
+
+    def startRun(self,scriptpath=None):
+        # load script if given, returns variables to run script with or None if script could not be compiled
+        self.stopRequested=False        # stopScript during loading stops the run before its first statement
+        self.stopped=False
+        if scriptpath!=None:
+            self.loadScript(scriptpath)
+        elif self.orgscriptlines==None:  
             raise ValueError("No script loaded. Please specify path or use loadScript(scriptpath) / setScript(listOfscriptlines) first.")
-            return
-        scriptlines=orgscriptlines    
-    # remove remarks
-    ret=removeRemarks(scriptlines)
-    if ret: scriptlines=ret
-    else:
-        printErrorStack()
-        if quitOnError: return     
-    # rewrite syntax
-    ret=rewriteSyntax(scriptlines)
-    if ret: scriptlines=ret
-    else:
-        printErrorStack()
-        if quitOnError: return     
-    # rewrite macros to core statements, returns false if error with brackets
-    ret=rewriteMacros(scriptlines)
-    if ret: scriptlines=ret
-    else:
-        printErrorStack()
-        if quitOnError: return     
-    # make room for variables and fill with systemvars
-    varis=systemVars.copy()
-    # convert labels to linenumbers and store as variables
-    varis=extractLabels(scriptlines,varis)
-    # process script
-    level=0
-    linenr=0
-    while linenr<len(scriptlines):                                  # follow lines and control statements until last line
-        statements=scriptline2statements(scriptlines[linenr])
-        if callbackHandler: callbackHandler(linenr)
-        #tokens=scriptline2tokens(scriptlines[linenr])
-        if statements:
-            for statement in statements:
-                statement=statement.strip()
-                tokens=statement2tokens(statement)
-                if tokens:
-                    #print (f"{linenr+1:02}> {statement.strip()}")
-
-                    # extract command
-                    cmd=tokens[0]                                       
-                    # convert tokens to evaluated arguments
-                    args=evalStatement(tokens,varis,linenr)
-                    nrArgs=len(args)
-                    # handle evaluation errors
-                    errors=0
-                    for argNr,arg in enumerate(args):
-                        if arg.__class__.__name__=='ValueError':
-                            logError(linenr,statement,tokens[argNr-1],f"EvalError: {arg.args[0].capitalize()}")
-                            linenr=len(scriptlines)
-                            errors+=1
-                    # handle command
-                    if not errors:
-                        if cmd=="var"      and checkArgs(linenr,statement,args,[[str],[str,float,bool,int,bytes],]):
-                            varis[args[0]]=args[1]                             # add variable to variable list
-                            #print (f"cmd==var:{args}")                        
-                            #print (f"  varis:{varis}")                        
-                        elif cmd in varis  and checkArgs(linenr,statement,args,[[str,float,int],]) : 
-                            varis[cmd]=args[0]                                  # change value of variable 
-                            #print (f"  set var '{cmd}' {args[0]} -> {varis}")
-                        elif cmd=="label"  and checkArgs(linenr,statement,args,[[str],]) : 
-                            pass                                                # already handled in extractLabels
-                        elif cmd=="sub"    and checkArgs(linenr,statement,args,[[int],]) : 
-                            ret=findSubEnd(scriptlines,linenr)                  # already handled in extractLabels
-                            if ret>-1: linenr=ret
-                            else     : 
-                                logError(linenr,statement2tokens,None,f"SyntaxError: Sub statement is missing matching 'return' statement.")
-                                linenr=len(scriptlines)
-                        elif cmd=="goto"   and checkArgs(linenr,statement,args,[[int],]):                           
-                            linenr=args[0]                                      # change linenr to that associated with label
-                        elif cmd=="gosub"  and checkArgs(linenr,statement,args,[[int],]):                           
-                            callStack.append(linenr)
-                            linenr=args[0]                                      # change linenr to that associated with label
-                        elif cmd=="return" and checkArgs(linenr,statement,args,[]):                           
-                            linenr=callStack.pop()
-                        elif cmd=="if"     and checkArgs(linenr,statement,args,[[bool],[int]]):   
-                            if args[0]: linenr=args[1]-1                        # set linenr -1 to offset linenr+=1 below
-                            #print (f"if {args[0]} {args[1]}")                
-                        #elif cmd=="print" and checkArgs(args,[[bool,int,float,str],]):   
-                        #    print (args[0])                                     # print message
-                        elif cmd=="exit"   and checkArgs(linenr,statement,args,[]):
-                            linenr=len(scriptlines)                             # print message
-                        elif cmd in systemDefs:                            
-                            functionH=systemDefs[cmd][0]
-                            allowedTypes=systemDefs[cmd][1]
-                            #print (f"system function:{cmd} {args} {allowedTypes} ")
-                            if checkArgs(linenr,statement,args,allowedTypes): 
-                                functionH(*args)                                # call external function
-                        else:
-                            logError(linenr,statement,arg,f"CmdError: Command '{cmd}'not valid.")
-                            linenr=len(scriptlines)
-                    #if we have no remark line we wait for delay so user can keep up.      
-                    if not (cmd=="var" and skipVarDelay):
-                        time.sleep(delaytime)
-                # if tokens 
-            # for statement in statements
-        # if statements           
-        linenr+=1
-    # while linenr<len(scriptlines)  
-    if errorStack:
-        printErrorStack()
+        # clear errorStack, but keep errors found on compile
+        self.errorStack=list(self.compileErrors)
+        if self.program==None:
+            self.printErrorStack()
+            return None
+        if self.profiled: self.endProfile()                                 # of started script which was not finished
+        if self.namespace is None: self.buildLayers()
+        # variables of script are stored in a new dict, system vars and labels stay in the shared layer below it
+        return {}
+
+    def buildLayers(self):
+        # make shared layers with labels (converted to linenumbers) above the system vars and namespace for eval,
+        # which has these layers above the module globals. A label hides a system var with the same name, which
+        # is reported with a warning and listed by shadowedVars.
+        self.shared=collections.ChainMap(self.program.labels,dict(self.systemVars))
+        self.namespace=dict(globals())
+        self.namespace.update(SCRIPT_FUNCTIONS)
+        self.namespace.update(self.systemVars)
+        self.namespace.update(self.program.labels)
+        if self.shadowedVars: warnShadowed(self.shadowedVars)
+
+    def endRun(self):
+        if self.output: self.output.flush()
+        if self.profiled: self.endProfile()
+        if self.debugged:
+            self.debugged.stop()
+            self.debugged=None
+            if self.errorStack and self.trace: self.errorStack.append(formatTrace(self.trace))
+        if self.errorStack:
+            self.printErrorStack()
+            return False
+        else:
+            return True
+
+    def runScript(self,scriptpath=None,delaytime=0, skipVarDelay=True, backend="interpreter"):
+        if backend not in ("interpreter","python"):
+            raise ValueError(f"Unknown backend '{backend}', should be 'interpreter' or 'python'.")
+        varis=self.varis=self.startRun(scriptpath)
+        if varis is None: return
+        # process script
+        try:
+            if self.profiling     : self.runProfiled(self.program,varis,delaytime,skipVarDelay)
+            elif self.debugging   : self.runProgram(self.debugProgram(self.program,varis),varis,delaytime,skipVarDelay)
+            elif backend=="python": self.runTranspiled(self.program,varis,delaytime,skipVarDelay)
+            else                  : self.runProgram(self.program,varis,delaytime,skipVarDelay)
+        finally:
+            if self.output: self.output.flush()                             # also if a system function raised
+        return self.endRun()
+
+    async def runScriptAsync(self,scriptpath=None,delaytime=0,skipVarDelay=True,sliceSize=ASYNC_SLICE_SIZE):
+        # same as runScript, but waits with asyncio.sleep, awaits coroutine system functions
+        # and gives other tasks a turn after each sliceSize instructions
+        varis=self.varis=self.startRun(scriptpath)
+        if varis is None: return
+        program=self.runningProgram(varis)
+        try:
+            for pause in self.executeProgram(program,varis,delaytime,skipVarDelay,0,sliceSize):
+                if pause is None:                                           # turn of other tasks is not profiled
+                    if self.profiled: self.profiled[0].pause()
+                    await asyncio.sleep(0)
+                    if self.profiled: self.profiled[0].resume()
+                elif pause.__class__ is int or pause.__class__ is float: await asyncio.sleep(pause)
+                else                                                   : await pause
+        finally:
+            if self.profiled: self.endProfile()                             # also if a system function raised
+        return self.endRun()
+
+    def startScript(self,scriptpath=None,checkpoint=None):
+        # prepare script to be run in parts by step and runFor, returns False if script could not be compiled or already finished
+        # with checkpoint the script continues where the checkpoint was made
+        self.varis=self.startRun(scriptpath)
+        if self.varis is None: return False
+        pc=0
+        if checkpoint is not None:
+            pc,self.callStack,varis=loadCheckpoint(checkpoint,self.checkpointKey())
+            self.varis.update(varis)
+        program=self.runningProgram(self.varis)
+        self.execution=self.executeProgram(program,self.varis,0,True,pc,sliceSize=0)
+        return self.resumeExecution(None)                                   # runs up to the first instruction
+
+    def resumeScript(self,checkpoint,scriptpath=None):
+        # run loaded script (or script of scriptpath) from checkpoint to its end, returns False on errors
+        if self.startScript(scriptpath,checkpoint): self.runFor(float("inf"),ASYNC_SLICE_SIZE)
+        return not self.errorStack
+
+    def checkpointKey(self):
+        # key of loaded script which checkpoints are checked against
+        if self.programKey is None: self.programKey=scriptKey(self.orgscriptlines,self.program.optimized is not None)
+        return self.programKey
+
+    def checkpoint(self):
+        # returns bytes with state of script paused in step mode or stopped with stopScript, see CHECKPOINTS
+        if self.pc is None or self.varis is None:
+            raise ValueError("No paused or stopped script to checkpoint, use startScript/step or stopScript on the interpreter backend.")
+        return dumpCheckpoint(self.checkpointKey(),self.pc,self.callStack,dict(self.varis))
+
+    def step(self,nrInstructions=1):
+        # run next nrInstructions of started script, returns False if script has finished
+        if self.execution is None: return False
+        if nrInstructions<1: return True                                    # nothing to run
+        return self.resumeExecution(nrInstructions)
+
+    def resumeExecution(self,nrInstructions):
+        # send number of instructions to run to execution, returns False if script has finished
+        try:
+            if self.profiled: self.profiled[0].resume()
+            pause=self.execution.send(nrInstructions)
+            while pause is not None:                                        # coroutine system function
+                runAwaitable(pause)
+                pause=next(self.execution)
+            if self.profiled: self.profiled[0].pause()                      # time between steps is not profiled
+            return True
+        except StopIteration:
+            self.execution=None
+            self.endRun()
+            return False
+
+    def runFor(self,seconds,sliceSize=100):
+        # run started script for at most seconds (checked after each sliceSize instructions), returns False if script has finished
+        deadline=time.perf_counter()+seconds
+        while self.step(sliceSize):
+            if time.perf_counter()>=deadline: return True
         return False
-    else:
+
+    def runRow(self,row):
+        # run loaded script with system vars updated by row, returns (variables of script, errorStack)
+        systemVars=self.systemVars
+        self.systemVars=dict(systemVars)
+        self.systemVars.update(row)
+        self.namespace=None
+        self.callStack=[]
+        try:
+            varis=self.startRun()
+            if varis is not None: self.runProgram(self.program,varis)
+        finally:
+            self.systemVars=systemVars
+            self.namespace=None
+            if self.output: self.output.flush()
+        return (varis if varis is not None else {}),self.errorStack
+
+    def batchClone(self):
+        # clone with the compiled script of this interpreter, which runs rows of runBatch without handlers
+        interpreter=self.clone()
+        interpreter.errorHandler=ignoreErrors
+        interpreter.callbackHandler=None
+        interpreter.profiling=False
+        interpreter.orgscriptlines,interpreter.program,interpreter.compileErrors=self.orgscriptlines,self.program,self.compileErrors
+        interpreter.programKey=self.programKey
+        return interpreter
+
+    def runVectorized(self,rows,names):
+        # run script once with arrays of the values in rows of names, returns list of (variables, errorStack)
+        # for each row or None if the script can not run vectorized
+        if any(value.__class__ is Array for value in [*self.systemVars.values(),*rows[0].values()]): return None
+        dependent=rowDependentVars(self.program,names,self.systemDefs)
+        if dependent is None: return None
+        interpreter=self.batchClone()
+        interpreter.systemVars.update(rows[0])
+        for name in names: interpreter.systemVars[name]=numpy.array([row[name] for row in rows],dtype=object)
+        varis=interpreter.startRun()
+        if varis is None: return None
+        interpreter.namespace.update(ROW_FUNCTIONS)
+        interpreter.runProgram(interpreter.program,varis)
+        if interpreter.errorStack: return None
+        results=[{} for row in rows]
+        for name,value in varis.items():
+            if (name in dependent)!=(value.__class__ is Array): return None    # e.g. reduced over the rows or array of script
+            if name in dependent:
+                if value.shape!=(len(rows),): return None
+                value=value.tolist()
+            else:
+                value=[value]*len(rows)
+            for result,item in zip(results,value): result[name]=item
+        return [(result,[]) for result in results]
+
+    def runBatch(self,paramTable,maxWorkers=None):
+        # run loaded script for each row of paramTable (list of dicts of system var name -> value), without delay
+        # and callbacks. Returns list of (variables of script after the run, errorStack) in same order as rows
+        rows=list(paramTable)
+        if self.orgscriptlines is None:
+            raise ValueError("No script loaded. Please specify path or use loadScript(scriptpath) / setScript(listOfscriptlines) first.")
+        if self.program is None: return [({},list(self.compileErrors)) for row in rows]
+        names=sweptNames(rows)
+        if names is not None:
+            results=self.runVectorized(rows,names)
+            if results is not None: return results
+        settings=(self.orgscriptlines,self.systemVars,self.systemDefs,self.optimize)
+        # rows run in this process if output goes to a sink or e.g. a system function is a lambda
+        try:
+            inProcess=self.output is not None or not pickle.dumps((settings,rows))
+        except Exception:
+            inProcess=True
+        if inProcess:
+            interpreter=self.batchClone()
+            return [interpreter.runRow(row) for row in rows]
+        maxWorkers=maxWorkers or os.cpu_count() or 1
+        with concurrent.futures.ProcessPoolExecutor(max_workers=maxWorkers,initializer=initBatchWorker,initargs=settings) as executor:
+            return list(executor.map(runBatchRow,rows,chunksize=max(1,len(rows)//(4*maxWorkers))))
+
+    def runMany(self,scripts,maxWorkers=None,**runArgs):
+        # run scripts (paths or lists of scriptlines) in a thread pool, each in a clone of this interpreter
+        # returns list of (result of runScript, errorStack) in same order as scripts
+        def run(script):
+            interpreter=self.clone()
+            if isinstance(script,list): interpreter.setScript(script)
+            else                      : interpreter.loadScript(script)
+            return interpreter.runScript(**runArgs),interpreter.errorStack
+        with concurrent.futures.ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+            return list(executor.map(run,scripts))
+
+class Scheduler:
+    # runs scripts of several interpreters in turn within a time budget for each tick
+    def __init__(self,sliceSize=100):
+        self.sliceSize=sliceSize
+        self.interpreters=[]
+        self.next=0
+
+    def add(self,interpreter,scriptpath=None):
+        # start script of interpreter and add it, returns False if script could not be compiled or already finished
+        if not interpreter.startScript(scriptpath): return False
+        self.interpreters.append(interpreter)
         return True
 
+    def tick(self,seconds):
+        # run sliceSize instructions of each script in turn until seconds have passed, next tick continues with next script
+        # returns number of scripts which have not finished
+        deadline=time.perf_counter()+seconds
+        while self.interpreters:
+            self.next%=len(self.interpreters)
+            if self.interpreters[self.next].step(self.sliceSize): self.next+=1
+            else                                                : del self.interpreters[self.next]
+            if time.perf_counter()>=deadline: break
+        return len(self.interpreters)
+
+#####################################################
+# USER FUNCTIONS
+#####################################################
+# The module level functions use a default interpreter instance. Its state is
+# available as module attributes, e.g. PyInterpreter.errorStack
+
+defaultInterpreter=Interpreter()
+
+def __getattr__(name):
+    if name in ('systemVars','systemDefs','callStack','errorStack','errorHandler','callbackHandler',
+                'quitOnError','orgscriptlines','program','compileErrors','profile','optimizeReport','trace'):
+        return getattr(defaultInterpreter,name)
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+clearGlobals       =defaultInterpreter.clear
+printErrorStack    =defaultInterpreter.printErrorStack
+setErrorHandler    =defaultInterpreter.setErrorHandler
+setCallbackHandler =defaultInterpreter.setCallbackHandler
+setScript          =defaultInterpreter.setScript
+loadScript         =defaultInterpreter.loadScript
+addSystemVar       =defaultInterpreter.addSystemVar
+addSystemFunction  =defaultInterpreter.addSystemFunction
+stopScript         =defaultInterpreter.stopScript
+setOutput          =defaultInterpreter.setOutput
+runScript          =defaultInterpreter.runScript
+runScriptAsync     =defaultInterpreter.runScriptAsync
+startScript        =defaultInterpreter.startScript
+step               =defaultInterpreter.step
+runFor             =defaultInterpreter.runFor
+checkpoint         =defaultInterpreter.checkpoint
+resumeScript       =defaultInterpreter.resumeScript
+runMany            =defaultInterpreter.runMany
+runBatch           =defaultInterpreter.runBatch
+setScriptCache     =defaultInterpreter.setScriptCache
+warmScriptCache    =defaultInterpreter.warmScriptCache
+setProfiler        =defaultInterpreter.setProfiler
+setOptimizer       =defaultInterpreter.setOptimizer
+profileReport      =defaultInterpreter.profileReport
+setBreakpoints     =defaultInterpreter.setBreakpoints
+setWatchpoints     =defaultInterpreter.setWatchpoints
+setTrace           =defaultInterpreter.setTrace
+setDebugHandler    =defaultInterpreter.setDebugHandler
+
 def importSystemFunction(self,filename,methodname):
     func = getattr(__import__(filename), methodname)
     #setattr(funcs,methodname,func)
     setattr(self,methodname,func)
 
+#####################################################
+# COMMAND LINE
+#####################################################
+# python PyInterpreter.py run [--jobs N] [--timeout S] [--backend B] [--setup module] [--summary file] paths
+# runs all scripts in the paths (files or folders, searched recursively) in a pool of
+# N processes. Each process is reused for many scripts, so it imports this module and
+# registers the system vars and functions once: pi, sleep and those registered by the
+# function setup(interpreter) of each setup module (module name or path of .py file).
+# A script running longer than the timeout is stopped at its next statement. If it has not
+# stopped RUN_KILL_DELAY seconds later, e.g. because it waits in a system function, its
+# process is killed and replaced by a new one. Each process runs one script at a time, so
+# a killed process takes no other scripts with it. For each script a JSON line with script,
+# status (ok, error, timeout or exception), runtime in seconds, errorStack and the printed
+# lines (output) is written to the summary (default stdout) in the order of the scripts,
+# other output of the processes goes to stderr. Exits with 1 if a script did not finish ok.
+
+RUN_KILL_DELAY=1.0      # seconds after the timeout before the process of a script is killed
+RUN_LOADED    ="loaded" # sent by process when script is loaded, the timeout starts then
+
+# interpreter and settings of process in pool of runCommand
+runInterpreter=None
+runBackend    ="interpreter"
+runTimeout    =None
+runOutput     =[]   # lines printed by script
+
+def findScripts(paths,extension=".pyi"):
+    scripts=[]
+    for path in paths:
+        if not os.path.isdir(path):
+            scripts.append(path)
+            continue
+        for folder,dirnames,filenames in os.walk(path):
+            dirnames[:]=[dirname for dirname in sorted(dirnames) if dirname!="__pycache__"]
+            scripts+=[os.path.join(folder,filename) for filename in sorted(filenames) if filename.endswith(extension)]
+    return scripts
+
+def loadSetup(module):
+    # returns setup function of module name or path of python file, raises ImportError if it has none
+    if module.endswith(".py"):
+        spec=importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(module))[0],module)
+        if spec is None: raise ImportError(f"Can not import setup module {module}.")
+        imported=importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(imported)
+    else:
+        if os.getcwd() not in sys.path: sys.path.append(os.getcwd())       # as with python -m
+        imported=importlib.import_module(module)
+    if not callable(getattr(imported,"setup",None)): raise ImportError(f"Setup module {module} has no function setup(interpreter).")
+    return imported.setup
+
+def initRunWorker(backend,timeout,setupModules=()):
+    global runInterpreter,runBackend,runTimeout
+    runBackend,runTimeout=backend,timeout
+    sys.stdout=sys.stderr                                                    # stdout of main process is for the summary only
+    runInterpreter=Interpreter()
+    runInterpreter.addSystemVar('pi',math.pi)
+    runInterpreter.addSystemFunction('sleep',time.sleep,[(int,float),])
+    for module in setupModules: loadSetup(module)(runInterpreter)
+    runInterpreter.setErrorHandler(ignoreErrors)                             # errors are written to summary
+    runInterpreter.setOutput(runOutput)                                      # printed lines are written to summary
+
+def watchTimeout(interpreter,timeout,done,lock,timedOut):
+    # stops script of interpreter after timeout seconds and repeats this until done is set,
+    # so a stop which comes before runScript resets stopRequested is not lost. done is set
+    # and checked under lock, so the stop never reaches the next script of the interpreter
+    if done.wait(timeout): return
+    while True:
+        with lock:
+            if done.is_set(): return
+            timedOut.append(True)
+            interpreter.stopScript()
+        if done.wait(0.05): return
+
+def runScriptFile(path,loaded=None):
+    # runs script in interpreter of this process, returns summary dict, loaded is called
+    # when the script is loaded and starts to run
+    interpreter=runInterpreter
+    interpreter.addSystemVar('scriptpath',os.path.realpath(path))
+    interpreter.callStack=[]
+    interpreter.errorStack=[]
+    timedOut=[]
+    done=threading.Event()
+    lock=threading.Lock()
+    start=time.perf_counter()
+    try:
+        interpreter.loadScript(path)                                        # timeout is for running, not for loading
+        if loaded: loaded()
+        if runTimeout: threading.Thread(target=watchTimeout,args=(interpreter,runTimeout,done,lock,timedOut),daemon=True).start()
+        ok=interpreter.runScript(backend=runBackend)
+        with lock: done.set()
+        status="timeout" if timedOut and interpreter.stopped else "ok" if ok else "error"
+        errorStack=interpreter.errorStack
+    except Exception as e:
+        status="exception"
+        errorStack=interpreter.errorStack+[f"{type(e).__name__}: {e}"]
+    finally:
+        with lock: done.set()
+        interpreter.output.flush()
+    output=list(runOutput)
+    runOutput.clear()
+    return {"script":path,"status":status,"runtime":round(time.perf_counter()-start,6),"errorStack":errorStack,"output":output}
+
+def runWorkerLoop(connection,initargs):
+    # main of process of runCommand, runs the scripts received on connection until it gets None
+    initRunWorker(*initargs)
+    while True:
+        path=connection.recv()
+        if path is None: return
+        connection.send(runScriptFile(path,lambda:connection.send(RUN_LOADED)))
+
+class RunWorker:
+    # process of runCommand with the script it runs, see runWorkerLoop
+
+    def __init__(self,context,initargs):
+        self.connection,child=context.Pipe()
+        self.process=context.Process(target=runWorkerLoop,args=(child,initargs),daemon=True)
+        self.process.start()
+        child.close()
+        self.index=None
+        self.path=None
+        self.start=None
+        self.deadline=None
+
+    def submit(self,index,path):
+        self.index,self.path=index,path
+        self.start=time.perf_counter()
+        self.deadline=None                                                  # loading has no timeout
+        self.connection.send(path)
+
+    def loaded(self,timeout):
+        if timeout: self.deadline=time.perf_counter()+timeout+RUN_KILL_DELAY
+
+    def failed(self,status,message):
+        # summary dict of script which did not return its summary
+        return {"script":self.path,"status":status,"runtime":round(time.perf_counter()-self.start,6),"errorStack":[message],"output":[]}
+
+    def close(self):
+        if self.process.is_alive():
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+            self.process.join(1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+def runCommand(argv):
+    parser=argparse.ArgumentParser(prog="PyInterpreter.py run")
+    parser.add_argument("paths",nargs="+")
+    parser.add_argument("--jobs",type=int,default=os.cpu_count() or 1)
+    parser.add_argument("--timeout",type=float,default=None)
+    parser.add_argument("--backend",default="interpreter",choices=("interpreter","python"))
+    parser.add_argument("--extension",default=".pyi")
+    parser.add_argument("--setup",action="append",default=[])
+    parser.add_argument("--summary",default="-")
+    args=parser.parse_args(argv)
+    for module in args.setup:
+        try:
+            loadSetup(module)                                               # report errors once, before starting the pool
+        except Exception as e:
+            parser.error(f"--setup {module}: {type(e).__name__}: {e}")
+    scripts=findScripts(args.paths,args.extension)
+    writer=sys.stdout if args.summary=="-" else open(args.summary,"w")
+    context=multiprocessing.get_context()
+    initargs=(args.backend,args.timeout,args.setup)
+    pending=collections.deque(enumerate(scripts))
+    idle=[RunWorker(context,initargs) for job in range(max(1,min(args.jobs,len(scripts))))]
+    busy={}         # connection -> worker running a script
+    results={}      # index of script -> summary dict, until it is written
+    written=0
+    failed=0
+    try:
+        while pending or busy:
+            while idle and pending:
+                worker=idle.pop()
+                worker.submit(*pending.popleft())
+                busy[worker.connection]=worker
+            deadlines=[worker.deadline for worker in busy.values() if worker.deadline is not None]
+            waitTime=max(0,min(deadlines)-time.perf_counter()) if deadlines else None
+            for connection in multiprocessing.connection.wait(list(busy),waitTime):
+                worker=busy[connection]
+                try:
+                    message=connection.recv()
+                    if message==RUN_LOADED:
+                        worker.loaded(args.timeout)
+                        continue
+                    del busy[connection]
+                    results[worker.index]=message
+                    idle.append(worker)
+                except EOFError:                                            # e.g. a system function exited the process
+                    del busy[connection]
+                    worker.kill()
+                    results[worker.index]=worker.failed("exception",f"ProcessError: Process of script exited with code {worker.process.exitcode}.")
+                    idle.append(RunWorker(context,initargs))
+            now=time.perf_counter()
+            for connection,worker in list(busy.items()):
+                if worker.deadline is not None and now>=worker.deadline:    # script did not stop after timeout
+                    del busy[connection]
+                    worker.kill()
+                    results[worker.index]=worker.failed("timeout",f"TimeoutError: Script did not stop after {args.timeout} seconds, its process was killed.")
+                    idle.append(RunWorker(context,initargs))
+            while written in results:
+                result=results.pop(written)
+                written+=1
+                if result["status"]!="ok": failed+=1
+                writer.write(json.dumps(result)+"\n")
+                writer.flush()
+    finally:
+        for worker in idle+list(busy.values()): worker.close()
+        if writer is not sys.stdout: writer.close()
+    return 1 if failed else 0
+
 if __name__=="__main__":
-  
+    if len(sys.argv)>1 and sys.argv[1]=="run":
+        sys.exit(runCommand(sys.argv[2:]))
+
     addSystemVar('scriptpath', scriptpath)
     addSystemVar('pi',         math.pi)
     addSystemFunction('sleep',time.sleep,[(int,float),])
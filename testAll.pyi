@@ -143,6 +143,24 @@ for a = 1...3 : 2 {
 }
 print f"{'OK  ' if b==2 else 'FAIL'} 'for a = 1...3 : 2 {'{'}'"
 
+print "\nArrays"
+print "------------"
+var buf array([1,2,3])
+print f"{'OK  ' if len(buf)==3 and buf[1]==2       else 'FAIL'} len(buf) buf[1]      = {len(buf)} {buf[1]} expected 3 2"
+print f"{'OK  ' if sum(buf*2+1)==15               else 'FAIL'} sum(buf*2+1)         = {sum(buf*2+1)} expected 15"
+print f"{'OK  ' if sum(10-buf)==24                else 'FAIL'} sum(10-buf)          = {sum(10-buf)} expected 24"
+print f"{'OK  ' if sum(2**buf)==14                else 'FAIL'} sum(2**buf)          = {sum(2**buf)} expected 14"
+print f"{'OK  ' if sum(7//buf)==12                else 'FAIL'} sum(7//buf)          = {sum(7//buf)} expected 12"
+print f"{'OK  ' if sum(7%buf)==2                  else 'FAIL'} sum(7%buf)           = {sum(7%buf)} expected 2"
+print f"{'OK  ' if sum(6/buf)==11                 else 'FAIL'} sum(6/buf)           = {sum(6/buf)} expected 11.0"
+print f"{'OK  ' if sum(buf==2)==1                 else 'FAIL'} sum(buf==2)          = {sum(buf==2)} expected 1"
+print f"{'OK  ' if sum(buf!=2)==2                 else 'FAIL'} sum(buf!=2)          = {sum(buf!=2)} expected 2"
+print f"{'OK  ' if sum(buf*buf)==14               else 'FAIL'} sum(buf*buf)         = {sum(buf*buf)} expected 14"
+print f"{'OK  ' if sum(buf[1:])==5                else 'FAIL'} sum(buf[1:])         = {sum(buf[1:])} expected 5"
+print f"{'OK  ' if min(buf)==1 and max(buf)==3    else 'FAIL'} min(buf) max(buf)    = {min(buf)} {max(buf)} expected 1 3"
+print f"{'OK  ' if mean(buf)==2                   else 'FAIL'} mean(buf)            = {mean(buf)} expected 2.0"
+print f"{'OK  ' if sum(zeros(3)+buf)==6           else 'FAIL'} sum(zeros(3)+buf)    = {sum(zeros(3)+buf)} expected 6.0"
+
 print "\nSystem Vars"
 print "------------"
 
@@ -0,0 +1,75 @@
+'''
+Regression tests of runBatch, run with 'python -m pytest test_batch.py' or 'python test_batch.py'.
+'''
+
+import pytest
+
+import PyInterpreter
+
+numpy=pytest.importorskip("numpy")   # without numpy runBatch never runs vectorized
+
+def runSeparate(scriptlines,row):
+    interpreter=PyInterpreter.Interpreter()
+    for name,value in row.items(): interpreter.addSystemVar(name,value)
+    interpreter.setScript(scriptlines)
+    interpreter.runScript()
+    return dict(interpreter.varis)
+
+def plainValues(varis):
+    # arrays compare element-wise, so compare them as lists
+    return {name:(value.tolist(),'array') if isinstance(value,PyInterpreter.Array) else value for name,value in varis.items()}
+
+def checkBatch(scriptlines,rows,vectorized=True):
+    interpreter=PyInterpreter.Interpreter()
+    interpreter.setScript(scriptlines)
+    names=PyInterpreter.sweptNames(rows)
+    assert (names is not None and interpreter.runVectorized(rows,names) is not None)==vectorized
+    results=interpreter.runBatch(rows)
+    for row,(varis,errorStack) in zip(rows,results):
+        assert errorStack==[]
+        expected=runSeparate(scriptlines,row)
+        assert plainValues(varis)==plainValues(expected)
+        assert [type(value) for value in varis.values()]==[type(value) for value in expected.values()]
+
+def test_intOverflow():
+    # ints of the rows are not limited to 64 bits
+    checkBatch(["var y 2**n\n","var z y*y-n\n"],[{'n':70},{'n':3}])
+
+def test_roundGivesInt():
+    checkBatch(["var y round(x*10)\n"],[{'x':0.24},{'x':1.5}])
+
+def test_mixedIntFloat():
+    # rows with an int and a float run separately
+    checkBatch(["var y x//2\n"],[{'x':7},{'x':7.5}],vectorized=False)
+
+def test_scriptArray():
+    # arrays of the script would broadcast against the arrays of the rows
+    checkBatch(["var y array([10,20])*x\n"],[{'x':1},{'x':2}],vectorized=False)
+
+def test_indexRow():
+    # indexing a number of the row would index the axis of the rows
+    interpreter=PyInterpreter.Interpreter()
+    interpreter.setScript(["var y x[::-1]\n"])
+    rows=[{'x':1},{'x':2}]
+    assert interpreter.runVectorized(rows,PyInterpreter.sweptNames(rows)) is None
+    for varis,errorStack in interpreter.runBatch(rows): assert "not subscriptable" in errorStack[0]
+
+def test_callWithRow():
+    checkBatch(["var y len(str(x))+abs(-x)\n"],[{'x':1},{'x':22}],vectorized=False)
+
+def test_elementwise():
+    checkBatch(["var y abs(-x)*2+round(x/3)\n","var z -(y**2)%7\n"],[{'x':1},{'x':22}])
+
+def test_systemVarArray():
+    interpreter=PyInterpreter.Interpreter()
+    interpreter.addSystemVar("buf",PyInterpreter.makeArray([10,20]))
+    interpreter.setScript(["var y buf*x\n"])
+    rows=[{'x':1},{'x':2}]
+    assert interpreter.runVectorized(rows,PyInterpreter.sweptNames(rows)) is None
+    assert [varis['y'].tolist() for varis,errorStack in interpreter.runBatch(rows)]==[[10,20],[20,40]]
+
+if __name__=="__main__":
+    for name,test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print ("OK  ",name)
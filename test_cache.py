@@ -0,0 +1,92 @@
+'''
+Regression tests of the script cache, run with 'python -m pytest test_cache.py'.
+'''
+
+import os
+
+import pytest
+
+import PyInterpreter
+
+@pytest.fixture
+def compiles(monkeypatch):
+    # list of scripts compiled, a script read from the cache is not compiled
+    compiled=[]
+    compileScript=PyInterpreter.compileScript
+    def counted(scriptlines,*args):
+        compiled.append(scriptlines)
+        return compileScript(scriptlines,*args)
+    monkeypatch.setattr(PyInterpreter,"compileScript",counted)
+    return compiled
+
+def writeScript(path,scriptlines):
+    path.write_text("".join(scriptlines))
+    return str(path)
+
+def loadAndRun(scriptpath,optimize=False,cacheDir=None):
+    interpreter=PyInterpreter.Interpreter()
+    interpreter.setErrorHandler(lambda errorStack:None)
+    interpreter.setScriptCache(cacheDir=cacheDir)
+    interpreter.setOptimizer(optimize)
+    interpreter.loadScript(scriptpath)
+    interpreter.runScript()
+    return dict(interpreter.varis or {})
+
+def test_cacheHit(tmp_path,compiles):
+    scriptpath=writeScript(tmp_path/"a.pyi",["var a 1\n","for i = 0 ... 5 {\n","a a*2\n","}\n"])
+    first=loadAndRun(scriptpath)
+    assert loadAndRun(scriptpath)==first=={'a':32,'i':5}
+    assert len(compiles)==1
+    assert os.listdir(tmp_path/"__pycache__")==["a.pyi"+PyInterpreter.CACHE_EXT]
+
+def test_changedScript(tmp_path,compiles):
+    scriptpath=writeScript(tmp_path/"a.pyi",["var a 1\n"])
+    assert loadAndRun(scriptpath)=={'a':1}
+    writeScript(tmp_path/"a.pyi",["var a 2\n"])
+    assert loadAndRun(scriptpath)=={'a':2}
+    assert len(compiles)==2
+
+def test_changedVersion(tmp_path,compiles,monkeypatch):
+    scriptpath=writeScript(tmp_path/"a.pyi",["var a 1\n"])
+    loadAndRun(scriptpath)
+    monkeypatch.setattr(PyInterpreter,"VERSION","new")
+    loadAndRun(scriptpath)
+    assert len(compiles)==2
+
+def test_optimizerHasOwnFile(tmp_path,compiles):
+    # interpreters with and without optimizer do not overwrite each other's cache
+    scriptpath=writeScript(tmp_path/"a.pyi",["var a 1\n","exit\n","a 2\n"])
+    for run in range(3):
+        assert loadAndRun(scriptpath)==loadAndRun(scriptpath,optimize=True)=={'a':1}
+    assert len(compiles)==2
+    assert sorted(os.listdir(tmp_path/"__pycache__"))==["a.pyi"+PyInterpreter.CACHE_OPT_EXT,"a.pyi"+PyInterpreter.CACHE_EXT]
+
+def test_damagedCache(tmp_path,compiles):
+    scriptpath=writeScript(tmp_path/"a.pyi",["var a 1\n"])
+    loadAndRun(scriptpath)
+    (tmp_path/"__pycache__"/("a.pyi"+PyInterpreter.CACHE_EXT)).write_bytes(b"damaged")
+    assert loadAndRun(scriptpath)=={'a':1}
+    assert loadAndRun(scriptpath)=={'a':1}
+    assert len(compiles)==2
+
+def test_errorsNotCached(tmp_path,compiles):
+    scriptpath=writeScript(tmp_path/"a.pyi",["if True {\n"])
+    loadAndRun(scriptpath)
+    loadAndRun(scriptpath)
+    assert len(compiles)==2
+    assert not os.path.exists(tmp_path/"__pycache__") or os.listdir(tmp_path/"__pycache__")==[]
+
+def test_cacheDir(tmp_path,compiles):
+    scriptpath=writeScript(tmp_path/"a.pyi",["var a 1\n"])
+    cacheDir=str(tmp_path/"cache")
+    loadAndRun(scriptpath,cacheDir=cacheDir)
+    assert loadAndRun(scriptpath,cacheDir=cacheDir)=={'a':1}
+    assert len(compiles)==1
+    assert len(os.listdir(cacheDir))==1 and not os.path.exists(tmp_path/"__pycache__")
+
+def test_warmScriptCache(tmp_path,compiles):
+    writeScript(tmp_path/"good.pyi",["var a 1\n"])
+    bad=writeScript(tmp_path/"bad.pyi",["if True {\n"])
+    assert PyInterpreter.Interpreter().warmScriptCache(str(tmp_path))==[bad]
+    loadAndRun(str(tmp_path/"good.pyi"))
+    assert len(compiles)==2
@@ -0,0 +1,105 @@
+'''
+Regression tests of checkpoints, run with 'python -m pytest test_checkpoint.py' or 'python test_checkpoint.py'.
+'''
+
+import pytest
+
+import PyInterpreter
+
+SCRIPT=["var total 0\n",
+        "var name \"sum\"\n",
+        "for i = 0 ... 10 {\n",
+        "  gosub add\n",
+        "}\n",
+        "var buf array([1,2,3])*total\n",
+        "exit\n",
+        "sub add\n",
+        "  total total+i\n",
+        "return\n"]
+
+def loaded(scriptlines=SCRIPT,optimize=False):
+    interpreter=PyInterpreter.Interpreter()
+    interpreter.setErrorHandler(lambda errorStack:None)
+    interpreter.setOptimizer(optimize)
+    interpreter.setScript(scriptlines)
+    return interpreter
+
+def plainValues(varis):
+    return {name:value.tolist() if isinstance(value,PyInterpreter.Array) else value for name,value in varis.items()}
+
+def expectedVaris():
+    interpreter=loaded()
+    interpreter.runScript()
+    return plainValues(interpreter.varis)
+
+@pytest.mark.parametrize("steps",[1,7,20,33])
+def test_roundTrip(steps):
+    # a script resumed from a checkpoint in another interpreter ends as a run without checkpoint
+    interpreter=loaded()
+    interpreter.startScript()
+    assert interpreter.step(steps)
+    saved=interpreter.checkpoint()
+    resumed=loaded()
+    assert resumed.resumeScript(saved)
+    assert plainValues(resumed.varis)==expectedVaris()
+
+def test_stepAfterResume():
+    interpreter=loaded()
+    interpreter.startScript()
+    interpreter.step(15)
+    resumed=loaded()
+    resumed.startScript(checkpoint=interpreter.checkpoint())
+    while resumed.step(3): pass
+    assert plainValues(resumed.varis)==expectedVaris()
+
+def test_stoppedScript():
+    # a script stopped with stopScript continues after the statement which stopped it
+    scriptlines=["var a 1\n","halt\n","a a+1\n"]
+    interpreter=loaded(scriptlines)
+    interpreter.addSystemFunction("halt",interpreter.stopScript,[])
+    interpreter.runScript()
+    assert interpreter.stopped and interpreter.varis=={'a':1}
+    resumed=loaded(scriptlines)
+    assert resumed.resumeScript(interpreter.checkpoint())
+    assert resumed.varis=={'a':2}
+
+def test_arraysStored():
+    interpreter=loaded(["var buf array([1.5,2])\n","var n 1\n"])
+    interpreter.startScript()
+    interpreter.step(1)
+    resumed=loaded(["var buf array([1.5,2])\n","var n 1\n"])
+    assert resumed.resumeScript(interpreter.checkpoint())
+    assert plainValues(resumed.varis)=={'buf':[1.5,2.0],'n':1}
+
+def test_refusedForOtherScript():
+    interpreter=loaded()
+    interpreter.startScript()
+    interpreter.step(5)
+    saved=interpreter.checkpoint()
+    with pytest.raises(ValueError,match="another script"):
+        loaded(SCRIPT+["var extra 1\n"]).startScript(checkpoint=saved)
+    with pytest.raises(ValueError,match="another script"):
+        loaded(optimize=True).startScript(checkpoint=saved)
+
+def test_refusedIfDamaged():
+    interpreter=loaded()
+    interpreter.startScript()
+    interpreter.step(5)
+    saved=interpreter.checkpoint()
+    with pytest.raises(ValueError,match="not a checkpoint"):
+        loaded().startScript(checkpoint=b"junk"+saved)
+    with pytest.raises(ValueError,match="could not be read"):
+        loaded().startScript(checkpoint=saved[:-3])
+
+def test_nothingToCheckpoint():
+    interpreter=loaded()
+    interpreter.runScript()
+    with pytest.raises(ValueError):
+        interpreter.checkpoint()
+
+if __name__=="__main__":
+    for name,test in list(globals().items()):
+        if name.startswith("test_"):
+            if name=="test_roundTrip": test(7)
+            else: test()
+            print ("OK  ",name)
@@ -0,0 +1,54 @@
+'''
+Regression tests of the optimizer, run with 'python -m pytest test_optimizer.py' or 'python test_optimizer.py'.
+'''
+
+import PyInterpreter
+
+def runScript(scriptlines,optimize):
+    interpreter=PyInterpreter.Interpreter()
+    interpreter.setErrorHandler(lambda errorStack:None)
+    lines=[]
+    interpreter.setOutput(lines)
+    interpreter.setOptimizer(optimize)
+    interpreter.setScript(scriptlines)
+    ok=interpreter.runScript()
+    return (ok,dict(interpreter.varis),interpreter.errorStack,lines),interpreter
+
+def checkOptimized(scriptlines):
+    # optimized script gives the same result, variables, errors and output, returns the optimizing interpreter
+    expected,plain=runScript(scriptlines,False)
+    result,optimized=runScript(scriptlines,True)
+    assert result==expected
+    assert len(optimized.program.instrs)<=len(plain.program.instrs)
+    return optimized
+
+def test_unreachableRemoved():
+    interpreter=checkOptimized(["var a 1\n","exit\n","a a+1\n"])
+    assert interpreter.optimizeReport["unreachable removed"]==1
+    assert len(interpreter.program.instrs)==2
+
+def test_jumpsThreaded():
+    interpreter=checkOptimized(["var a 0\n","goto L1\n","a 9\n","label L1\n","goto L2\n","a 5\n","label L2\n","a a+1\n"])
+    report=interpreter.optimizeReport
+    assert report["gotos made jumps"]==2 and report["labels removed"]==2 and report["jumps threaded"]==1
+    assert [instr[0] for instr in interpreter.program.instrs]==[PyInterpreter.OP_VAR,PyInterpreter.OP_SET]
+
+def test_dynamicJumpKeepsLines():
+    # a goto to a calculated line can reach every line, so nothing is removed as unreachable
+    interpreter=checkOptimized(["var a 0\n","var t 3\n","goto t\n","exit\n","a 7\n"])
+    assert interpreter.optimizeReport["unreachable removed"]==0
+    assert interpreter.varis['a']==7
+
+def test_constantBranch():
+    interpreter=checkOptimized(["var a 0\n","if 1>2 {\n","a 3\n","}\n","print a\n"])
+    assert interpreter.optimizeReport["branches made jumps"]==1
+
+def test_errorOnOriginalLine():
+    interpreter=checkOptimized(["var a 0\n","if 1>2 {\n","a 3\n","}\n","var b 1/a\n"])
+    assert interpreter.errorStack[0].startswith("0005 >")
+
+if __name__=="__main__":
+    for name,test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print ("OK  ",name)
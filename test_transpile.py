@@ -0,0 +1,49 @@
+'''
+Regression tests of the python backend, run with 'python -m pytest test_transpile.py' or 'python test_transpile.py'.
+'''
+
+import math
+
+import PyInterpreter
+
+def runBackend(scriptlines,backend):
+    interpreter=PyInterpreter.Interpreter()
+    interpreter.addSystemVar('pi',math.pi)
+    interpreter.setErrorHandler(lambda errorStack:None)
+    lines=[]
+    interpreter.setOutput(lines)
+    interpreter.setScript(scriptlines)
+    ok=interpreter.runScript(backend=backend)
+    return ok,dict(interpreter.varis),interpreter.errorStack,lines
+
+def checkBackends(scriptlines):
+    # the python backend gives the same result, variables, errors and output as the interpreter
+    expected=runBackend(scriptlines,"interpreter")
+    assert runBackend(scriptlines,"python")==expected
+    return expected
+
+def hotLoop(statement):
+    # loop which runs often enough to be transpiled
+    return ["var s 0\n",f"for i = 0 ... {2*PyInterpreter.TRANSPILE_HOT_HITS} {{\n",statement,"}\n"]
+
+def test_lambdaSeesSystemVars():
+    ok,varis,errorStack,lines=checkBackends(hotLoop("s s+(lambda:pi)()\n"))
+    assert ok and errorStack==[]
+
+def test_lambdaSeesScriptFunctions():
+    ok,varis,errorStack,lines=checkBackends(hotLoop("s s+(lambda:sum(array([1,2])))()\n"))
+    assert ok and varis['s']==3*2*PyInterpreter.TRANSPILE_HOT_HITS
+
+def test_varisHoldsScriptVarsOnly():
+    ok,varis,errorStack,lines=checkBackends(hotLoop("s s+pi\n"))
+    assert sorted(varis)==['i','s']
+
+def test_sameError():
+    ok,varis,errorStack,lines=checkBackends(hotLoop("s s+1/(i-12)\n"))
+    assert not ok and len(errorStack)==1
+
+if __name__=="__main__":
+    for name,test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print ("OK  ",name)